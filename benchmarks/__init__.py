@@ -0,0 +1,6 @@
+"""
+Benchmarks for the store. They import the top-level modules of the
+repository, so run each one as a module from the repository root, for
+example python -m benchmarks.suite --help; running a file directly
+(python benchmarks/suite.py) cannot find those modules.
+"""
@@ -0,0 +1,93 @@
+import bisect
+import itertools
+import random
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import Promotion, PercentDiscount, SecondHalfPrice, ThirdOneFree
+from store import Store
+
+DEFAULT_PROMOTION_MIX = {"none": 0.7, "percent": 0.1, "second_half": 0.1, "third_free": 0.1}
+
+
+def shared_promotions() -> Dict[str, Optional[Promotion]]:
+    return {"none": None,
+            "percent": PercentDiscount.shared("30% off!", percent=30),
+            "second_half": SecondHalfPrice.shared("Second Half price!"),
+            "third_free": ThirdOneFree.shared("Third One Free!")}
+
+
+def generate_catalog(size: int, promotion_mix: Optional[Dict[str, float]] = None,
+                     limited_ratio: float = 0.05, non_stocked_ratio: float = 0.02,
+                     seed: int = 0) -> Iterator[Product]:
+    """
+    Yield a synthetic catalog of products.
+
+    Args:
+        size (int): Number of products.
+        promotion_mix (dict): Share of products per promotion kind, keyed
+            like DEFAULT_PROMOTION_MIX.
+        limited_ratio (float): Share of LimitedProduct.
+        non_stocked_ratio (float): Share of NonStockedProduct.
+        seed (int): Random seed; the same arguments always give the same catalog.
+    """
+    rng = random.Random(seed)
+    mix = promotion_mix or DEFAULT_PROMOTION_MIX
+    promotions = shared_promotions()
+    kinds = list(mix)
+    weights = list(itertools.accumulate(mix[kind] for kind in kinds))
+    for i in range(size):
+        price = rng.randint(1, 2000)
+        draw = rng.random()
+        if draw < non_stocked_ratio:
+            product = NonStockedProduct(f"Product {i}", price=price)
+        elif draw < non_stocked_ratio + limited_ratio:
+            product = LimitedProduct(f"Product {i}", price=price, quantity=10 ** 6,
+                                     maximum=rng.randint(1, 5))
+        else:
+            product = Product(f"Product {i}", price=price, quantity=10 ** 6)
+        kind = kinds[bisect.bisect(weights, rng.random() * weights[-1])]
+        product.promotion = promotions[kind]
+        yield product
+
+
+def generate_store(size: int, **catalog_options) -> Store:
+    return Store(list(generate_catalog(size, **catalog_options)))
+
+
+class Workload:
+    """
+    Random shopping lists over a catalog.
+
+    Products are picked with Zipf skew: the product of rank r is chosen
+    with weight 1 / r ** skew, so skew=0 is uniform and skew around 1
+    concentrates orders on a few hot products. Order sizes (number of
+    lines) follow a geometric distribution with the given mean, and each
+    line buys between 1 and max_quantity units.
+    """
+
+    def __init__(self, products: Sequence[Product], skew: float = 1.0,
+                 mean_lines: float = 3.0, max_quantity: int = 3, seed: int = 0):
+        self.products = list(products)
+        self.rng = random.Random(seed)
+        self.rng.shuffle(self.products)
+        self.cumulative = list(itertools.accumulate(
+            1 / rank ** skew for rank in range(1, len(self.products) + 1)))
+        self.mean_lines = mean_lines
+        self.max_quantity = max_quantity
+
+    def pick(self) -> Product:
+        index = bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[-1])
+        return self.products[min(index, len(self.products) - 1)]
+
+    def order_size(self) -> int:
+        lines = 1
+        while self.rng.random() > 1 / self.mean_lines:
+            lines += 1
+        return lines
+
+    def shopping_list(self) -> List[Tuple[Product, int]]:
+        return [(self.pick(), self.rng.randint(1, self.max_quantity))
+                for _ in range(self.order_size())]
+
+    def shopping_lists(self, count: int) -> List[List[Tuple[Product, int]]]:
+        return [self.shopping_list() for _ in range(count)]
@@ -0,0 +1,63 @@
+import argparse
+import json
+import time
+from typing import Callable, Dict
+import metrics
+from benchmarks.generators import Workload, generate_store
+
+
+def _best(run: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(size: int = 10_000, orders: int = 20_000, repeat: int = 5, seed: int = 0) -> Dict:
+    """
+    Time the same order workload with instrumentation never enabled,
+    enabled with the built-in Metrics hook, and disabled again.
+
+    Returns:
+        Dict: Orders per second in each state and the overhead of the
+        disabled and enabled states relative to the baseline.
+    """
+    store = generate_store(size, seed=seed)
+    shopping_lists = Workload(store.products, seed=seed).shopping_lists(orders)
+
+    def place_orders():
+        for shopping_list in shopping_lists:
+            try:
+                store.checkout(shopping_list)
+            except ValueError:
+                pass
+
+    baseline = _best(place_orders, repeat)
+    recorder = metrics.Metrics()
+    metrics.add_hook(recorder)
+    metrics.enable()
+    try:
+        enabled = _best(place_orders, repeat)
+    finally:
+        metrics.disable()
+        metrics.remove_hook(recorder)
+    disabled = _best(place_orders, repeat)
+    return {"orders": orders,
+            "baseline_orders_per_second": orders / baseline,
+            "enabled_orders_per_second": orders / enabled,
+            "disabled_orders_per_second": orders / disabled,
+            "enabled_overhead": enabled / baseline - 1,
+            "disabled_overhead": disabled / baseline - 1}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the cost of instrumentation.",
+        epilog="Run from the repository root as: python -m benchmarks.instrumentation")
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.size, args.orders, args.repeat), indent=2))
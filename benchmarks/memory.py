@@ -0,0 +1,99 @@
+import argparse
+import gc
+import json
+import threading
+import tracemalloc
+from typing import Callable, Dict
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import SecondHalfPrice
+
+
+class OriginalProduct:
+    """
+    The per-instance layout of the original Product, before the catalog
+    indexes and locking: a __dict__ with five attributes.
+    """
+
+    def __init__(self, name: str, price: float, quantity: int):
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+        self.active = True
+        self.promotion = None
+
+
+class DictProduct:
+    """
+    The per-instance layout Product had right before __slots__: the
+    original attributes plus a product id, a list of stores and a lock per
+    product, all in a __dict__. This is the state the slots change started
+    from, not the original class; see OriginalProduct for that.
+    """
+
+    def __init__(self, name: str, price: float, quantity: int, product_id: int):
+        self.name = name
+        self._price = price
+        self.quantity = quantity
+        self.active = True
+        self.promotion = None
+        self.product_id = product_id
+        self._stores = []
+        self._lock = threading.RLock()
+
+
+def bytes_per_object(factory: Callable[[int], object], count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [factory(i) for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    # Each object also costs one slot in the list holding it.
+    return (after - before) / len(objects) - 8
+
+
+def report(count: int = 100_000) -> Dict[str, float]:
+    """
+    Measure bytes per product for the original layout, the layout right
+    before __slots__ ("pre_slots") and the current one.
+
+    Names repeat across products, as they do in real catalogs with many
+    variants of one model, so the effect of interning shows up.
+    """
+    promotion = SecondHalfPrice.shared("Second Half price!")
+
+    def name(i: int) -> str:
+        return "".join(["Product ", str(i % 1000)])
+
+    def promoted(i: int) -> Product:
+        product = Product(name(i), price=10.0, quantity=5)
+        product.promotion = promotion
+        return product
+
+    def dict_promoted(i: int) -> DictProduct:
+        product = DictProduct(name(i), 10.0, 5, i)
+        product.promotion = promotion
+        return product
+
+    return {
+        "original_product": bytes_per_object(lambda i: OriginalProduct(name(i), 10.0, 5), count),
+        "pre_slots_product": bytes_per_object(lambda i: DictProduct(name(i), 10.0, 5, i), count),
+        "pre_slots_product_with_promotion": bytes_per_object(dict_promoted, count),
+        "product": bytes_per_object(lambda i: Product(name(i), 10.0, 5), count),
+        "product_with_shared_promotion": bytes_per_object(promoted, count),
+        "non_stocked_product": bytes_per_object(
+            lambda i: NonStockedProduct(name(i), 10.0), count),
+        "limited_product": bytes_per_object(
+            lambda i: LimitedProduct(name(i), 10.0, 5, maximum=1), count),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report memory used per product.",
+        epilog="Run from the repository root as: python -m benchmarks.memory")
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+    print(json.dumps(report(args.count), indent=2))
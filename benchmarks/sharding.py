@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+from benchmarks.generators import Workload, generate_catalog
+from sharded import ShardedStore
+from store import Store
+
+
+def run(size: int = 10_000, orders: int = 50_000, processes: List[int] = None,
+        batch_size: int = 1000, seed: int = 0) -> Dict:
+    """
+    Time the same order workload on a single in-process Store and on
+    ShardedStores with a growing number of worker processes.
+
+    Returns:
+        Dict: Orders per second for the single store and for each process
+        count, and the speedup of each process count over one process.
+    """
+    processes = processes or [1, 2, 4, os.cpu_count() or 1]
+    catalog = list(generate_catalog(size, seed=seed))
+    workload = Workload(catalog, seed=seed)
+    workload_lists = workload.shopping_lists(orders)
+    shopping_lists = [[(product.product_id, quantity) for product, quantity in shopping_list]
+                      for shopping_list in workload_lists]
+
+    sharded = {}
+    for count in sorted(set(processes)):
+        with ShardedStore(catalog, processes=count) as sharded_store:
+            started = time.perf_counter()
+            for start in range(0, orders, batch_size):
+                sharded_store.checkout_many(shopping_lists[start:start + batch_size])
+            sharded[count] = orders / (time.perf_counter() - started)
+    # Shards copy the catalog when they start, so the in-process baseline
+    # runs last on the original products.
+    store = Store(catalog)
+    started = time.perf_counter()
+    for shopping_list in workload_lists:
+        try:
+            store.checkout(shopping_list)
+        except ValueError:
+            pass
+    single = orders / (time.perf_counter() - started)
+    base = sharded[min(sharded)]
+    return {"orders": orders, "batch_size": batch_size,
+            "single_store_orders_per_second": single,
+            "sharded_orders_per_second": sharded,
+            "speedup": {count: rate / base for count, rate in sharded.items()}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure how order throughput scales with shards.",
+        epilog="Run from the repository root as: python -m benchmarks.sharding")
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--processes", help="Comma separated process counts, e.g. 1,2,4,8.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    counts = [int(count) for count in args.processes.split(",")] if args.processes else None
+    print(json.dumps(run(args.size, args.orders, counts, args.batch_size), indent=2))
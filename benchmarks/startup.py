@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from products import Product
+from promotions import SecondHalfPrice, ThirdOneFree
+from store import Store
+import persistence
+
+
+def _catalog(products: int, seed: int) -> Store:
+    rng = random.Random(seed)
+    promotions = [None, None, SecondHalfPrice("Second Half price!"), ThirdOneFree("Third One Free!")]
+    catalog = []
+    for i in range(products):
+        product = Product(f"SKU {i}", price=rng.randint(1, 2000), quantity=rng.randint(1, 1000))
+        product.promotion = rng.choice(promotions)
+        catalog.append(product)
+    return Store(catalog)
+
+
+def _sell(store: Store, changes: int, seed: int):
+    rng = random.Random(seed)
+    catalog = store.products
+    for _ in range(changes):
+        product = rng.choice(catalog)
+        if product.get_quantity():
+            product.buy(1)
+
+
+def _timed_open(directory: str) -> float:
+    started = time.perf_counter()
+    _, journal = persistence.open_store(directory)
+    elapsed = time.perf_counter() - started
+    journal.close()
+    return elapsed
+
+
+def run(products: int, history: int, tail: int, seed: int = 0) -> dict:
+    """
+    Compare restarting from a snapshot plus log tail with replaying the whole log.
+
+    Both directories see the same catalog and the same history of sales;
+    only the snapshot directory takes a snapshot before the last tail sales.
+    """
+    root = tempfile.mkdtemp(prefix="bestbuy-startup-")
+    try:
+        results = {"products": products, "history": history, "tail": tail}
+        for mode in ("full_log", "snapshot"):
+            directory = os.path.join(root, mode)
+            store, journal = persistence.open_store(
+                directory, initial=lambda: _catalog(products, seed))
+            _sell(store, history, seed)
+            if mode == "snapshot":
+                started = time.perf_counter()
+                journal.snapshot()
+                results["snapshot_write_seconds"] = time.perf_counter() - started
+            _sell(store, tail, seed + 1)
+            journal.close()
+            results[f"{mode}_bytes"] = sum(os.path.getsize(os.path.join(directory, name))
+                                          for name in os.listdir(directory))
+            results[f"{mode}_restart_seconds"] = _timed_open(directory)
+
+        started = time.perf_counter()
+        snapshot = persistence.Snapshot(os.path.join(root, "snapshot", "snapshot.bin"))
+        results["snapshot_mmap_seconds"] = time.perf_counter() - started
+        snapshot.close()
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark persistent store restart time.",
+        epilog="Run from the repository root as: python -m benchmarks.startup")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--history", type=int, default=500_000)
+    parser.add_argument("--tail", type=int, default=1_000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.products, args.history, args.tail), indent=2))
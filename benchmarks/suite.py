@@ -0,0 +1,247 @@
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+import pricing
+from benchmarks.generators import Workload, generate_store
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The function receives (store, workload, operations)
+    and returns (run, count): a callable that performs the timed work and
+    the number of operations it performs, or None when it cannot run here.
+    """
+    def decorator(setup: Callable) -> Callable:
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def _lines(workload: Workload, operations: int):
+    return [line for _ in range(operations) for line in workload.shopping_list()][:operations]
+
+
+@benchmark("product_buy")
+def _product_buy(store, workload, operations):
+    lines = _lines(workload, operations)
+
+    def run():
+        for product, quantity in lines:
+            try:
+                product.buy(quantity)
+            except ValueError:
+                pass
+    return run, len(lines)
+
+
+@benchmark("store_order")
+def _store_order(store, workload, operations):
+    shopping_lists = workload.shopping_lists(operations)
+
+    def run():
+        for shopping_list in shopping_lists:
+            try:
+                store.checkout(shopping_list)
+            except ValueError:
+                pass
+    return run, len(shopping_lists)
+
+
+@benchmark("store_quote")
+def _store_quote(store, workload, operations):
+    shopping_lists = workload.shopping_lists(operations)
+
+    def run():
+        for shopping_list in shopping_lists:
+            try:
+                store.quote(shopping_list)
+            except ValueError:
+                pass
+    return run, len(shopping_lists)
+
+
+@benchmark("get_all_products")
+def _get_all_products(store, workload, operations):
+    calls = max(1, operations // 1000)
+
+    def run():
+        for _ in range(calls):
+            store.get_all_products()
+    return run, calls
+
+
+@benchmark("get_total_quantity")
+def _get_total_quantity(store, workload, operations):
+    def run():
+        for _ in range(operations):
+            store.get_total_quantity()
+    return run, operations
+
+
+@benchmark("promotion_per_item")
+def _promotion_per_item(store, workload, operations):
+    lines = [(product, quantity) for product, quantity in _lines(workload, operations)
+             if product.promotion is not None]
+
+    def run():
+        for product, quantity in lines:
+            product.promotion.apply_promotion(product, quantity)
+    return run, len(lines)
+
+
+@benchmark("promotion_batch")
+def _promotion_batch(store, workload, operations):
+    if numpy is None:
+        return None
+    lines = [(product, quantity) for product, quantity in _lines(workload, operations)
+             if product.promotion is not None]
+    promotions = list({id(product.promotion): product.promotion
+                       for product, _ in lines}.values())
+    promotion_ids = {id(promotion): i for i, promotion in enumerate(promotions)}
+    prices = [product.price for product, _ in lines]
+    quantities = [quantity for _, quantity in lines]
+    ids = [promotion_ids[id(product.promotion)] for product, _ in lines]
+
+    def run():
+        pricing.price_lines(prices, quantities, ids, promotions, lambda line: lines[line][0])
+    return run, len(lines)
+
+
+@benchmark("columnar_order_batch")
+def _columnar_order_batch(store, workload, operations):
+    if numpy is None:
+        return None
+    from columnar_store import ColumnarStore
+    columnar = ColumnarStore(store.products, capacity=len(store.products))
+    lines = _lines(workload, operations)
+    product_ids = numpy.array([product.product_id for product, _ in lines])
+    quantities = numpy.array([quantity for _, quantity in lines])
+
+    def run():
+        columnar.order_batch(product_ids, quantities)
+    return run, len(lines)
+
+
+def _time(run: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run_suite(sizes: List[int], operations: int = 10_000, repeat: int = 3,
+              names: Optional[List[str]] = None, skew: float = 1.0,
+              mean_lines: float = 3.0, seed: int = 0, **catalog_options) -> Dict:
+    """
+    Run the registered benchmarks for every catalog size.
+
+    Returns:
+        Dict: Run metadata and one result per (benchmark, size), with the
+        best time of `repeat` runs and the resulting operations per second.
+    """
+    results = []
+    for size in sizes:
+        store = generate_store(size, seed=seed, **catalog_options)
+        for name in names or list(BENCHMARKS):
+            workload = Workload(store.products, skew=skew, mean_lines=mean_lines, seed=seed)
+            prepared = BENCHMARKS[name](store, workload, operations)
+            if prepared is None:
+                continue
+            run, count = prepared
+            seconds = _time(run, repeat)
+            ops_per_second = count / seconds if seconds else None
+            results.append({"name": name, "size": size, "operations": count,
+                            "seconds": seconds, "ops_per_second": ops_per_second})
+            print(f"{name:>22} size={size:<10} {ops_per_second or 0:>14,.0f} ops/s",
+                  file=sys.stderr)
+        del store
+    return {"meta": {"python": platform.python_version(),
+                     "platform": platform.platform(),
+                     "numpy": numpy.__version__ if numpy else None,
+                     "operations": operations, "repeat": repeat, "skew": skew,
+                     "mean_lines": mean_lines, "seed": seed,
+                     "catalog": catalog_options,
+                     "timestamp": time.time()},
+            "results": results}
+
+
+def compare(old: Dict, new: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Compare two suite runs.
+
+    Returns:
+        List[Dict]: One entry per benchmark present in both runs, with the
+        speed ratio (new / old) and whether it regressed by more than threshold.
+    """
+    baseline = {(result["name"], result["size"]): result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        before = baseline.get((result["name"], result["size"]))
+        if before is None or not before["ops_per_second"] or not result["ops_per_second"]:
+            continue
+        ratio = result["ops_per_second"] / before["ops_per_second"]
+        rows.append({"name": result["name"], "size": result["size"],
+                     "old_ops_per_second": before["ops_per_second"],
+                     "new_ops_per_second": result["ops_per_second"],
+                     "ratio": ratio, "regression": ratio < 1 - threshold})
+    return rows
+
+
+def _sizes(text: str) -> List[int]:
+    return [int(float(size)) for size in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Best Buy hot path benchmarks.",
+        epilog="Run from the repository root as: python -m benchmarks.suite")
+    parser.add_argument("--sizes", type=_sizes, default=[1_000, 10_000, 100_000],
+                        help="Comma separated catalog sizes, e.g. 1e3,1e5,1e7.")
+    parser.add_argument("--operations", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--benchmarks", help="Comma separated benchmark names.")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf skew of product picks.")
+    parser.add_argument("--mean-lines", type=float, default=3.0, help="Mean lines per order.")
+    parser.add_argument("--limited-ratio", type=float, default=0.05)
+    parser.add_argument("--non-stocked-ratio", type=float, default=0.02)
+    parser.add_argument("--promotion-mix", type=json.loads,
+                        help='JSON object, e.g. {"none": 0.5, "percent": 0.5}.')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="Compare two result files instead of running.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Slowdown ratio reported as a regression.")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            rows = compare(json.load(f_old), json.load(f_new), args.threshold)
+        print(json.dumps(rows, indent=2))
+        sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+    report = run_suite(args.sizes, args.operations, args.repeat,
+                       args.benchmarks.split(",") if args.benchmarks else None,
+                       args.skew, args.mean_lines, args.seed,
+                       promotion_mix=args.promotion_mix,
+                       limited_ratio=args.limited_ratio,
+                       non_stocked_ratio=args.non_stocked_ratio)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,456 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+import numpy as np
+import pricing
+import rules
+from products import Product, NonStockedProduct, LimitedProduct, new_product_id
+from promotions import Promotion
+from store import Store
+
+KIND_STOCKED = 0
+KIND_NON_STOCKED = 1
+KIND_LIMITED = 2
+
+NO_PROMOTION = -1
+
+ACCEPTED = 0
+UNKNOWN_PRODUCT = 1
+NON_STOCKED = 2
+OVER_MAXIMUM = 3
+NOT_POSITIVE = 4
+OUT_OF_STOCK = 5
+
+REASONS = {
+    ACCEPTED: "",
+    UNKNOWN_PRODUCT: "Product is not in the store.",
+    NON_STOCKED: "Non-stocked products cannot be purchased.",
+    OVER_MAXIMUM: "Product can only be ordered up to its maximum per order.",
+    NOT_POSITIVE: "Quantity to buy should be positive.",
+    OUT_OF_STOCK: "Not enough quantity available.",
+}
+
+
+class ColumnarProduct(Product):
+    """
+    A Product whose state lives in a row of a ColumnarStore.
+
+    The concrete view classes below declare the _store and _row slots
+    themselves: LimitedProduct already adds a slot, so a base class adding
+    more would give ColumnarLimitedProduct conflicting layouts.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, store: 'ColumnarStore', row: int):
+        self._store = store
+        self._row = row
+        self._stores = ()
+
+    @property
+    def product_id(self) -> int:
+        return int(self._store._product_id[self._row])
+
+    @property
+    def name(self) -> str:
+        return self._store._names[self._row]
+
+    @property
+    def price(self) -> float:
+        return float(self._store._price[self._row])
+
+    @price.setter
+    def price(self, price: float):
+        if price < 0:
+            raise ValueError("Price cannot be negative.")
+        self._store._price[self._row] = price
+
+    @property
+    def quantity(self) -> int:
+        return int(self._store._quantity[self._row])
+
+    @quantity.setter
+    def quantity(self, quantity: int):
+        self._store._quantity[self._row] = quantity
+
+    @property
+    def active(self) -> bool:
+        return bool(self._store._active[self._row])
+
+    @active.setter
+    def active(self, active: bool):
+        self._store._active[self._row] = active
+
+    @property
+    def promotion(self) -> Optional[Promotion]:
+        return self._store._promotion_of(self._row)
+
+    @promotion.setter
+    def promotion(self, promotion: Optional[Promotion]):
+        self._store._promotion[self._row] = self._store._promotion_id(promotion)
+
+    def show(self) -> str:
+        # Batch orders change rows without going through the views, so
+        # there is nothing to invalidate a cached string with.
+        return self._render()
+
+
+class ColumnarStockedProduct(ColumnarProduct):
+    __slots__ = ("_store", "_row")
+
+
+class ColumnarNonStockedProduct(ColumnarProduct, NonStockedProduct):
+    __slots__ = ("_store", "_row")
+
+
+class ColumnarLimitedProduct(ColumnarProduct, LimitedProduct):
+    __slots__ = ("_store", "_row")
+
+    @property
+    def maximum(self) -> int:
+        return int(self._store._maximum[self._row])
+
+
+_VIEW_TYPES = {
+    KIND_STOCKED: ColumnarStockedProduct,
+    KIND_NON_STOCKED: ColumnarNonStockedProduct,
+    KIND_LIMITED: ColumnarLimitedProduct,
+}
+
+
+class BatchResult(NamedTuple):
+    """
+    Outcome of ColumnarStore.order_batch, one entry per order line.
+    """
+    status: np.ndarray
+    totals: np.ndarray
+
+    @property
+    def accepted(self) -> np.ndarray:
+        return self.status == ACCEPTED
+
+    @property
+    def total(self) -> float:
+        return float(self.totals.sum())
+
+    def reason(self, line: int) -> str:
+        return REASONS[int(self.status[line])]
+
+
+class ColumnarStore:
+    """
+    Store backend that keeps product state in NumPy columns.
+
+    Products added to the store are copied into a row; the store hands out
+    ColumnarProduct views over those rows, so code written against Product
+    keeps working. Bulk orders go through order_batch, which checks and
+    applies many order lines in a single vectorized pass.
+    """
+
+    def __init__(self, products: Sequence[Product] = (), capacity: int = 1024,
+                 order_rules: Optional[List[rules.Rule]] = None):
+        capacity = max(capacity, 1)
+        self._rules = rules.RuleEngine(rules.DEFAULT_RULES if order_rules is None else order_rules)
+        self._size = 0
+        self._names: List[str] = []
+        self._product_id = np.empty(capacity, dtype=np.int64)
+        self._kind = np.empty(capacity, dtype=np.int8)
+        self._price = np.empty(capacity, dtype=np.float64)
+        self._quantity = np.empty(capacity, dtype=np.int64)
+        self._active = np.empty(capacity, dtype=np.bool_)
+        self._maximum = np.empty(capacity, dtype=np.int64)
+        self._promotion = np.empty(capacity, dtype=np.int32)
+        self._rows: Dict[int, int] = {}
+        self._by_name: Dict[str, Dict[int, None]] = {}
+        self._views: Dict[int, ColumnarProduct] = {}
+        self._sorted_ids: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # The _promotion column holds indexes into this store's own table.
+        self._promotions: List[Promotion] = []
+        self._promotion_ids: Dict[Promotion, int] = {}
+        # Store.checkout looks here for listeners; columnar rows have none.
+        self._listeners: list = []
+        for product in products:
+            self.add_product(product)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def products(self) -> List[Product]:
+        return [self._view(row) for row in range(self._size)]
+
+    def _columns(self) -> List[np.ndarray]:
+        return [self._product_id, self._kind, self._price, self._quantity,
+                self._active, self._maximum, self._promotion]
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = len(self._price)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for attr in ("_product_id", "_kind", "_price", "_quantity",
+                     "_active", "_maximum", "_promotion"):
+            old = getattr(self, attr)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, attr, new)
+
+    def _promotion_of(self, row: int) -> Optional[Promotion]:
+        promotion_id = self._promotion[row]
+        return None if promotion_id == NO_PROMOTION else self._promotions[promotion_id]
+
+    def _promotion_id(self, promotion: Optional[Promotion]) -> int:
+        if promotion is None:
+            return NO_PROMOTION
+        promotion_id = self._promotion_ids.get(promotion)
+        if promotion_id is None:
+            promotion_id = self._promotion_ids[promotion] = len(self._promotions)
+            self._promotions.append(promotion)
+        return promotion_id
+
+    def _view(self, row: int) -> ColumnarProduct:
+        view = self._views.get(row)
+        if view is None:
+            view = _VIEW_TYPES[int(self._kind[row])](self, row)
+            self._views[row] = view
+        return view
+
+    def add_rows(self, names: Sequence[str], prices, quantities, maximums=None,
+                 kinds=None, product_ids=None, promotions=None) -> np.ndarray:
+        """
+        Append many products at once without building Product objects.
+
+        Args:
+            names: Product names, one per row.
+            prices: Prices, one per row.
+            quantities: Quantities in stock, one per row.
+            maximums: Per-order maximum for KIND_LIMITED rows (ignored otherwise).
+            kinds: KIND_STOCKED, KIND_NON_STOCKED or KIND_LIMITED per row.
+            product_ids: Explicit product ids; fresh ones are allocated if omitted.
+            promotions: Optional Promotion (or None) per row.
+
+        Returns:
+            np.ndarray: The product ids of the new rows.
+        """
+        count = len(names)
+        prices = np.asarray(prices, dtype=np.float64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        kinds = (np.full(count, KIND_STOCKED, dtype=np.int8) if kinds is None
+                 else np.asarray(kinds, dtype=np.int8))
+        maximums = (np.zeros(count, dtype=np.int64) if maximums is None
+                    else np.asarray(maximums, dtype=np.int64))
+        if product_ids is None:
+            product_ids = [new_product_id() for _ in range(count)]
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+
+        if any(not name for name in names):
+            raise ValueError("Product name cannot be empty.")
+        if (prices < 0).any():
+            raise ValueError("Price cannot be negative.")
+        if (quantities < 0).any():
+            raise ValueError("Quantity cannot be negative.")
+        if ((kinds == KIND_LIMITED) & (maximums < 0)).any():
+            raise ValueError("Maximum allowed quantity cannot be negative.")
+        if len(set(product_ids.tolist())) != count or any(
+                product_id in self._rows for product_id in product_ids.tolist()):
+            raise ValueError("Product ids must be unique within the store.")
+
+        self._reserve(count)
+        start, stop = self._size, self._size + count
+        self._product_id[start:stop] = product_ids
+        self._kind[start:stop] = kinds
+        self._price[start:stop] = prices
+        self._quantity[start:stop] = np.where(kinds == KIND_NON_STOCKED, 0, quantities)
+        self._active[start:stop] = True
+        self._maximum[start:stop] = maximums
+        if promotions is None:
+            self._promotion[start:stop] = NO_PROMOTION
+        else:
+            self._promotion[start:stop] = [self._promotion_id(promotion)
+                                           for promotion in promotions]
+        self._names.extend(names)
+        for row, (product_id, name) in enumerate(zip(product_ids.tolist(), names), start):
+            self._rows[product_id] = row
+            self._by_name.setdefault(name, {})[product_id] = None
+        self._size = stop
+        self._sorted_ids = None
+        return product_ids
+
+    def add_product(self, product: Product) -> ColumnarProduct:
+        """
+        Copy a product into the store.
+
+        Args:
+            product (Product): The product to add.
+
+        Returns:
+            ColumnarProduct: The view to use for the product from now on.
+        """
+        if isinstance(product, NonStockedProduct):
+            kind, maximum = KIND_NON_STOCKED, 0
+        elif isinstance(product, LimitedProduct):
+            kind, maximum = KIND_LIMITED, product.maximum
+        else:
+            kind, maximum = KIND_STOCKED, 0
+        self.add_rows([product.name], [product.price], [product.quantity], [maximum],
+                      [kind], [product.product_id], [product.promotion])
+        row = self._size - 1
+        self._active[row] = product.is_active()
+        return self._view(row)
+
+    def remove_product(self, product: Product):
+        row = self._rows.pop(product.product_id, None)
+        if row is None:
+            raise ValueError("Product is not in the store.")
+        same_name = self._by_name[self._names[row]]
+        del same_name[product.product_id]
+        if not same_name:
+            del self._by_name[self._names[row]]
+
+        removed = self._views.pop(row, None)
+        last = self._size - 1
+        if row != last:
+            for column in self._columns():
+                column[row] = column[last]
+            self._names[row] = self._names[last]
+            self._rows[int(self._product_id[row])] = row
+            moved = self._views.pop(last, None)
+            if moved is not None:
+                moved._row = row
+                self._views[row] = moved
+        self._names.pop()
+        self._size = last
+        self._sorted_ids = None
+        if removed is not None:
+            removed._store = None
+
+    def get_product(self, product_id: int) -> Optional[ColumnarProduct]:
+        row = self._rows.get(product_id)
+        return None if row is None else self._view(row)
+
+    def get_product_by_name(self, name: str) -> Optional[ColumnarProduct]:
+        same_name = self._by_name.get(name)
+        if not same_name:
+            return None
+        return self._view(self._rows[next(iter(same_name))])
+
+    def get_total_quantity(self) -> int:
+        return int(self._quantity[:self._size].sum())
+
+    def get_total_value(self) -> float:
+        size = self._size
+        return float(self._quantity[:size] @ self._price[:size])
+
+    def get_all_products(self) -> List[Product]:
+        return [self._view(row) for row in np.flatnonzero(self._active[:self._size]).tolist()]
+
+    def cart(self, shopping_list: List[Tuple[Product, int]]) -> rules.Cart:
+        """
+        Like Store.cart, but each line's product is replaced by this store's
+        view of it, matched by product_id, so ordering the objects the store
+        was built from changes the rows rather than the copies.
+
+        Raises:
+            ValueError: If a product is not in the store.
+        """
+        if isinstance(shopping_list, rules.Cart):
+            return shopping_list
+        lines = []
+        for product, quantity in shopping_list:
+            row = self._rows.get(product.product_id) if isinstance(product, Product) else None
+            if row is None:
+                raise ValueError("Product is not in the store.")
+            lines.append((self._view(row), quantity))
+        return self._rules.apply(lines)
+
+    check_cart = Store.check_cart
+
+    # The public order methods look Store's up at call time rather than
+    # aliasing them, so they run whatever metrics.enable() has installed.
+    def quote(self, shopping_list: List[Tuple[Product, int]]) -> float:
+        return Store.quote(self, shopping_list)
+
+    def checkout(self, shopping_list: List[Tuple[Product, int]]) -> float:
+        return Store.checkout(self, shopping_list)
+
+    def checkout_many(self, shopping_lists: Sequence[List[Tuple[Product, int]]]
+                      ) -> List[Union[float, ValueError]]:
+        return Store.checkout_many(self, shopping_lists)
+
+    def order(self, shopping_list: List[Tuple[Product, int]]) -> float:
+        return Store.order(self, shopping_list)
+
+    def rows_for(self, product_ids) -> np.ndarray:
+        """
+        Map product ids to rows, with -1 for ids that are not in the store.
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if self._sorted_ids is None:
+            order = np.argsort(self._product_id[:self._size], kind="stable")
+            self._sorted_ids = (self._product_id[:self._size][order], order)
+        sorted_ids, order = self._sorted_ids
+        if not len(sorted_ids):
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(sorted_ids, product_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[position] == product_ids, order[position], -1)
+
+    def _line_totals(self, rows: np.ndarray, quantities: np.ndarray) -> np.ndarray:
+        promotion_ids = self._promotion[rows]
+        used = np.unique(promotion_ids[promotion_ids != NO_PROMOTION])
+        local_ids = np.where(promotion_ids == NO_PROMOTION, -1,
+                             np.searchsorted(used, promotion_ids))
+        return pricing.price_lines(self._price[rows], quantities, local_ids,
+                                   [self._promotions[int(i)] for i in used],
+                                   lambda line: self._view(int(rows[line])))
+
+    def order_batch(self, product_ids, quantities) -> BatchResult:
+        """
+        Validate and apply many order lines in one vectorized pass.
+
+        Every line is checked on its own against the same rules Product.buy
+        and LimitedProduct.buy apply. Lines for the same product are filled
+        in the order given until one no longer fits the remaining stock;
+        that line and later lines for the product are rejected as out of
+        stock. Accepted lines decrement stock and products that run out are
+        deactivated.
+
+        Args:
+            product_ids: Product id of each order line.
+            quantities: Quantity of each order line.
+
+        Returns:
+            BatchResult: Per-line status codes and prices.
+        """
+        quantities = np.asarray(quantities, dtype=np.int64)
+        rows = self.rows_for(product_ids)
+        status = np.zeros(len(rows), dtype=np.int8)
+        status[rows < 0] = UNKNOWN_PRODUCT
+        safe_rows = np.where(rows < 0, 0, rows)
+        kinds = self._kind[safe_rows]
+
+        pending = status == ACCEPTED
+        status[pending & (kinds == KIND_NON_STOCKED)] = NON_STOCKED
+        pending = status == ACCEPTED
+        over = (kinds == KIND_LIMITED) & (quantities > self._maximum[safe_rows])
+        status[pending & over] = OVER_MAXIMUM
+        pending = status == ACCEPTED
+        status[pending & (quantities <= 0)] = NOT_POSITIVE
+
+        lines = np.flatnonzero(status == ACCEPTED)
+        lines = lines[np.argsort(rows[lines], kind="stable")]
+        line_rows, line_quantities = rows[lines], quantities[lines]
+        demand = np.cumsum(line_quantities)
+        first = np.ones(len(lines), dtype=bool)
+        first[1:] = line_rows[1:] != line_rows[:-1]
+        demand -= np.maximum.accumulate(np.where(first, demand - line_quantities, 0))
+        fits = demand <= self._quantity[line_rows]
+        status[lines[~fits]] = OUT_OF_STOCK
+
+        accepted = lines[fits]
+        accepted_rows = rows[accepted]
+        totals = np.zeros(len(rows), dtype=np.float64)
+        totals[accepted] = self._line_totals(accepted_rows, quantities[accepted])
+        np.subtract.at(self._quantity, accepted_rows, quantities[accepted])
+        touched = np.unique(accepted_rows)
+        self._active[touched[self._quantity[touched] == 0]] = False
+        return BatchResult(status, totals)
@@ -0,0 +1,261 @@
+import argparse
+import csv
+import itertools
+import json
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+import main
+import persistence
+import store
+from products import Product
+
+
+class RawOrder(NamedTuple):
+    order_id: str
+    line: int
+    items: List[Tuple[object, object]]
+    error: Optional[str] = None
+    item_lines: Tuple[int, ...] = ()  # The source line of each item.
+
+
+class Order(NamedTuple):
+    order_id: str
+    line: int
+    shopping_list: List[Tuple[Product, int]]
+    price: float
+    item_lines: Tuple[int, ...] = ()
+
+
+def _quantity(value) -> int:
+    """
+    Read a quantity, rejecting fractions instead of truncating them.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return int(value)
+    raise ValueError(f"Quantity must be a whole number, not {value!r}.")
+
+
+class Rejected(NamedTuple):
+    order_id: str
+    line: int
+    reason: str
+
+
+class StageStats:
+    """
+    Items and time seen by one pipeline stage.
+
+    seconds counts the time spent pulling items through the stage and
+    everything upstream of it; report() subtracts the upstream part.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+
+    def timed(self, iterable: Iterable) -> Iterator:
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds += clock() - started
+                return
+            self.seconds += clock() - started
+            self.items += 1
+            yield item
+
+
+def read_csv(source: TextIO) -> Iterator[RawOrder]:
+    """
+    Parse CSV rows with product_id (or product, by name) and quantity
+    columns. Consecutive rows sharing an order_id form one order; without
+    an order_id column every row is its own order.
+    """
+    reader = csv.DictReader(source)
+    rows = enumerate(reader, start=2)
+    if "order_id" in (reader.fieldnames or ()):
+        groups = itertools.groupby(rows, key=lambda numbered: numbered[1]["order_id"])
+    else:
+        groups = ((str(line), [(line, row)]) for line, row in rows)
+    for order_id, numbered_rows in groups:
+        items = []
+        item_lines = []
+        for line, row in numbered_rows:
+            item_lines.append(line)
+            items.append((row.get("product_id") or row.get("product"), row.get("quantity")))
+        yield RawOrder(order_id, item_lines[0], items, item_lines=tuple(item_lines))
+
+
+def read_json_lines(source: TextIO) -> Iterator[RawOrder]:
+    """
+    Parse JSON Lines orders such as
+    {"order_id": "A1", "items": [{"product_id": 3, "quantity": 2}]}.
+    Items may also name the product with "product" or be [product, quantity] pairs.
+    """
+    for line, text in enumerate(source, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+            items = [(item.get("product_id", item.get("product")), item.get("quantity"))
+                     if isinstance(item, dict) else tuple(item)
+                     for item in record["items"]]
+            yield RawOrder(str(record.get("order_id", line)), line, items,
+                           item_lines=(line,) * len(items))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            yield RawOrder(str(line), line, [], f"Unparseable order: {e}")
+
+
+class Pipeline:
+    """
+    Streaming order import: parse -> validate -> apply.
+
+    Every stage is a generator, so memory use depends on batch_size and
+    not on the size of the input. Each batch is checked out with one
+    Store.checkout_many call, and the checkout total is the order's price.
+    Rejected orders, with the ValueError reason from Product.buy or
+    LimitedProduct.buy, are written to the dead-letter file as JSON lines
+    instead of being printed. Lines that the order rules drop from an
+    accepted order, such as a repeated once-per-order item, are written
+    there too, with the order's id and line. With a journal, orders are
+    only counted as accepted once their batch is on disk.
+    """
+
+    def __init__(self, store: store.Store, dead_letter: TextIO, batch_size: int = 1000,
+                 journal: Optional[persistence.Journal] = None):
+        self.store = store
+        self.journal = journal
+        self.dead_letter = dead_letter
+        self.batch_size = batch_size
+        self.stages = [StageStats(name) for name in ("parse", "validate", "apply")]
+        self.accepted = 0
+        self.rejected = 0
+        self.revenue = 0.0
+
+    def _reject(self, rejection: Rejected):
+        self.rejected += 1
+        self._dead_letter(rejection)
+
+    def _dead_letter(self, rejection: Rejected):
+        self.dead_letter.write(json.dumps(rejection._asdict()) + "\n")
+
+    def _resolve(self, key) -> Product:
+        product = None
+        if isinstance(key, int) or (isinstance(key, str) and key.strip().isdigit()):
+            product = self.store.get_product(int(key))
+        if product is None and isinstance(key, str):
+            product = self.store.get_product_by_name(key)
+        if product is None:
+            raise ValueError(f"Unknown product {key!r}.")
+        return product
+
+    def validate(self, raw_orders: Iterable[RawOrder]) -> Iterator[Order]:
+        for raw in raw_orders:
+            if raw.error:
+                self._reject(Rejected(raw.order_id, raw.line, raw.error))
+                continue
+            try:
+                shopping_list = [(self._resolve(key), _quantity(quantity))
+                                 for key, quantity in raw.items]
+            except (ValueError, TypeError) as e:
+                self._reject(Rejected(raw.order_id, raw.line, str(e)))
+                continue
+            yield Order(raw.order_id, raw.line, shopping_list, 0.0, raw.item_lines)
+
+    def apply(self, orders: Iterable[Order]) -> Iterator[Order]:
+        iterator = iter(orders)
+        while True:
+            batch = list(itertools.islice(iterator, self.batch_size))
+            if not batch:
+                return
+            carts = [self.store.cart(order.shopping_list) for order in batch]
+            results = self.store.checkout_many(carts)
+            if self.journal is not None:
+                self.journal.wait_durable()
+            for order, cart, result in zip(batch, carts, results):
+                if isinstance(result, ValueError):
+                    self._reject(Rejected(order.order_id, order.line, str(result)))
+                    continue
+                for dropped in cart.dropped:
+                    line = (order.item_lines[dropped.index] if order.item_lines
+                            else order.line)
+                    self._dead_letter(Rejected(order.order_id, line, dropped.reason))
+                self.accepted += 1
+                self.revenue += result
+                yield order._replace(price=result)
+
+    def run(self, raw_orders: Iterable[RawOrder]) -> Dict:
+        """
+        Push every order through the pipeline and return the report.
+        """
+        parse, validate, apply = self.stages
+        started = time.perf_counter()
+        stream = parse.timed(raw_orders)
+        stream = validate.timed(self.validate(stream))
+        stream = apply.timed(self.apply(stream))
+        for _ in stream:
+            pass
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed: float) -> Dict:
+        stages = {}
+        upstream = 0.0
+        for stage in self.stages:
+            own = max(stage.seconds - upstream, 0.0)
+            upstream = stage.seconds
+            stages[stage.name] = {"items": stage.items, "seconds": own,
+                                  "items_per_second": stage.items / own if own else None}
+        return {"accepted": self.accepted, "rejected": self.rejected,
+                "revenue": self.revenue, "seconds": elapsed,
+                "orders_per_second": (self.accepted + self.rejected) / elapsed if elapsed else None,
+                "stages": stages}
+
+
+def ingest(path: str, store: store.Store, dead_letter_path: str,
+           batch_size: int = 1000, file_format: Optional[str] = None,
+           journal: Optional[persistence.Journal] = None) -> Dict:
+    """
+    Import an order file (CSV or JSON Lines) into a store.
+
+    Args:
+        path (str): The order file.
+        store (store.Store): The store to apply the orders to.
+        dead_letter_path (str): Where rejected orders are written.
+        batch_size (int): Orders applied per batch.
+        file_format (str): "csv" or "jsonl"; guessed from the file name if omitted.
+        journal (persistence.Journal): The store's journal, if it is persistent.
+
+    Returns:
+        Dict: Accepted/rejected counts, revenue and per-stage throughput.
+    """
+    file_format = file_format or ("csv" if path.endswith(".csv") else "jsonl")
+    reader = read_csv if file_format == "csv" else read_json_lines
+    with open(path, newline="") as source, open(dead_letter_path, "w") as dead_letter:
+        return Pipeline(store, dead_letter, batch_size, journal).run(reader(source))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import an order file into the store.")
+    parser.add_argument("path", help="CSV or JSON Lines order file.")
+    parser.add_argument("--dead-letter", default="rejected_orders.jsonl")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--data-dir", help="Import into the persistent store in this directory.")
+    args = parser.parse_args()
+    journal = None
+    if args.data_dir:
+        best_buy, journal = persistence.open_store(args.data_dir, initial=main.initialize_store)
+    else:
+        best_buy = main.initialize_store()
+    try:
+        print(json.dumps(ingest(args.path, best_buy, args.dead_letter, args.batch_size,
+                                args.format, journal), indent=2))
+    finally:
+        if journal is not None:
+            journal.close()
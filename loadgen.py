@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List
+from service import percentile
+
+
+async def _request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: dict) -> dict:
+    writer.write(json.dumps(request).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def _client(host: str, port: int, requests: int, catalog: List[int],
+                  order_ratio: float, seed: int, latencies: List[float], errors: List[str]):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            if rng.random() < order_ratio:
+                items = [[product_id, rng.randint(1, 3)]
+                         for product_id in rng.sample(catalog, rng.randint(1, min(3, len(catalog))))]
+                request = {"op": "order", "items": items}
+            else:
+                request = {"op": rng.choice(["total", "quote"]),
+                           "items": [[rng.choice(catalog), 1]]}
+            started = time.perf_counter()
+            response = await _request(reader, writer, request)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not response["ok"]:
+                errors.append(response["error"])
+    finally:
+        writer.close()
+
+
+async def run_load(host: str, port: int, clients: int = 50, requests: int = 200,
+                   order_ratio: float = 0.8, seed: int = 0) -> dict:
+    """
+    Drive an order service with concurrent clients and measure it.
+
+    Args:
+        host (str): Service host.
+        port (int): Service port.
+        clients (int): Number of concurrent connections.
+        requests (int): Requests sent by each client, one at a time.
+        order_ratio (float): Share of requests that are orders; the rest
+            are total and quote requests.
+        seed (int): Seed for the random request mix.
+
+    Returns:
+        dict: Request count, requests per second, p50/p99 latency in
+        milliseconds and the number of rejected requests.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    catalog = [product["product_id"]
+               for product in (await _request(reader, writer, {"op": "list"}))["result"]]
+    writer.close()
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, requests, catalog, order_ratio,
+                                   seed + i, latencies, errors)
+                           for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {"requests": len(latencies),
+            "requests_per_second": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50),
+            "p99_ms": percentile(latencies, 0.99),
+            "rejected": len(errors)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the Best Buy order service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--order-ratio", type=float, default=0.8)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run_load(args.host, args.port, args.clients,
+                                          args.requests, args.order_ratio)), indent=2))
@@ -1,7 +1,12 @@
+import argparse
+from typing import Iterator, List, Optional, Tuple
+import persistence
 import products
 import promotions
 import store
 
+PAGE_SIZE = 20
+
 
 def display_menu():
     """
@@ -14,19 +19,40 @@ def display_menu():
     print("4. Quit")
 
 
+def paged(store: store.Store) -> Iterator[Tuple[List[products.Product], bool]]:
+    """
+    Page through the active products of the store.
+
+    Args:
+        store (store.Store): The store to list.
+
+    Returns:
+        Iterator: (page, more) pairs, where more tells whether another page follows.
+    """
+    pages = store.query(page_size=PAGE_SIZE)
+    page = next(pages, None)
+    while page is not None:
+        following = next(pages, None)
+        yield page, following is not None
+        page = following
+
+
 def list_products(store: store.Store):
     """
-    List all products available in the store.
+    List all products available in the store, a page at a time.
 
     Args:
         store (store.Store): The store object containing products.
     """
-    products = store.get_all_products()
-    if not products:
-        print("No products available at the moment.")
-    else:
-        for product in products:
+    listed = False
+    for page, more in paged(store):
+        listed = True
+        for product in page:
             print(product.show())
+        if more and input("Press Enter for more products, or q to stop: ").strip().lower() == "q":
+            break
+    if not listed:
+        print("No products available at the moment.")
 
 
 def show_total_amount(store: store.Store):
@@ -40,14 +66,17 @@ def show_total_amount(store: store.Store):
     print(f"Total amount of all products in store: {total_quantity}")
 
 
-def make_order(store: store.Store):
+def make_order(store: store.Store, journal: Optional[persistence.Journal] = None):
     """
     Allow the user to make an order by selecting products and quantities.
 
     Args:
         store (store.Store): The store object to handle product orders.
+        journal (persistence.Journal): The store's journal, if it is persistent;
+            the order is only confirmed once it is on disk.
     """
-    products = store.get_all_products()
+    pages = paged(store)
+    products, more = next(pages, ([], False))
     if not products:
         print("No products available to order.")
         return
@@ -59,8 +88,15 @@ def make_order(store: store.Store):
     shopping_list = []
     while True:
         try:
-            product_idx = int(
-                input("Enter the product number to buy (0 to finish): ")) - 1
+            hint = ", Enter for more products" if more else ""
+            answer = input(f"Enter the product number to buy (0 to finish{hint}): ")
+            if more and not answer.strip():
+                page, more = next(pages)
+                for idx, product in enumerate(page, start=len(products)):
+                    print(f"{idx + 1}. {product.show()}")
+                products = products + page
+                continue
+            product_idx = int(answer) - 1
             if product_idx == -1:
                 break
             if 0 <= product_idx < len(products):
@@ -77,6 +113,8 @@ def make_order(store: store.Store):
 
     if shopping_list:
         total_price = store.order(shopping_list)
+        if journal is not None:
+            journal.wait_durable()
         if total_price > 0:
             print(f"Total price of the order: {total_price:.2f} dollars.")
     else:
@@ -98,9 +136,9 @@ def initialize_store() -> store.Store:
         products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
     ]
 
-    second_half_price = promotions.SecondHalfPrice("Second Half price!")
-    third_one_free = promotions.ThirdOneFree("Third One Free!")
-    thirty_percent = promotions.PercentDiscount("30% off!", percent=30)
+    second_half_price = promotions.SecondHalfPrice.shared("Second Half price!")
+    third_one_free = promotions.ThirdOneFree.shared("Third One Free!")
+    thirty_percent = promotions.PercentDiscount.shared("30% off!", percent=30)
 
     product_list[0].set_promotion(second_half_price)
     product_list[1].set_promotion(third_one_free)
@@ -109,12 +147,13 @@ def initialize_store() -> store.Store:
     return store.Store(product_list)
 
 
-def start(store: store.Store):
+def start(store: store.Store, journal: Optional[persistence.Journal] = None):
     """
     Start the main menu loop allowing the user to interact with the store.
 
     Args:
         store (store.Store): The store object to interact with.
+        journal (persistence.Journal): The store's journal, if it is persistent.
     """
     while True:
         display_menu()
@@ -125,7 +164,7 @@ def start(store: store.Store):
         elif choice == "2":
             show_total_amount(store)
         elif choice == "3":
-            make_order(store)
+            make_order(store, journal)
         elif choice == "4":
             print("Goodbye!")
             break
@@ -134,5 +173,17 @@ def start(store: store.Store):
 
 
 if __name__ == "__main__":
-    best_buy = initialize_store()
-    start(best_buy)
+    parser = argparse.ArgumentParser(description="Best Buy store menu.")
+    parser.add_argument("--data-dir",
+                        help="Keep the store's inventory in this directory across restarts.")
+    args = parser.parse_args()
+    if args.data_dir:
+        best_buy, journal = persistence.open_store(args.data_dir, initial=initialize_store)
+        try:
+            start(best_buy, journal)
+        finally:
+            journal.snapshot()
+            journal.close()
+    else:
+        best_buy = initialize_store()
+        start(best_buy)
@@ -0,0 +1,316 @@
+import bisect
+import functools
+import inspect
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from products import Product
+from promotions import Promotion
+from store import Store
+
+# hook(event, seconds, args, error) is called after every instrumented call.
+Hook = Callable[[str, float, tuple, Optional[BaseException]], None]
+
+LATENCY_BUCKETS = (0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005,
+                   0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+_STORE_METHODS = {
+    "checkout": "order",
+    "quote": "quote",
+    "get_all_products": "get_all_products",
+    "get_total_quantity": "get_total_quantity",
+    "get_product": "get_product",
+    "get_product_by_name": "get_product_by_name",
+    "query": "query",
+}
+
+_hooks: List[Hook] = []
+_originals: Dict[Tuple[type, str], Callable] = {}
+
+
+def _promotion_classes() -> List[type]:
+    classes, pending = [], [Promotion]
+    while pending:
+        cls = pending.pop()
+        classes.append(cls)
+        pending.extend(cls.__subclasses__())
+    return [cls for cls in classes if "apply_promotion" in vars(cls)
+            and not getattr(vars(cls)["apply_promotion"], "__isabstractmethod__", False)]
+
+
+def _wrap(original: Callable, event: str) -> Callable:
+    clock = time.perf_counter
+
+    @functools.wraps(original)
+    def instrumented(*args, **kwargs):
+        started = clock()
+        try:
+            result = original(*args, **kwargs)
+        except BaseException as e:
+            elapsed = clock() - started
+            for hook in _hooks:
+                hook(event, elapsed, args, e)
+            raise
+        elapsed = clock() - started
+        for hook in _hooks:
+            hook(event, elapsed, args, None)
+        return result
+    return instrumented
+
+
+def _wrap_pages(original: Callable, event: str) -> Callable:
+    """
+    Like _wrap, for generator methods: each item (a page of a query) is
+    timed as one call, since creating the generator does no work.
+    """
+    clock = time.perf_counter
+
+    @functools.wraps(original)
+    def instrumented(*args, **kwargs):
+        pages = original(*args, **kwargs)
+        while True:
+            started = clock()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except BaseException as e:
+                elapsed = clock() - started
+                for hook in _hooks:
+                    hook(event, elapsed, args, e)
+                raise
+            elapsed = clock() - started
+            for hook in _hooks:
+                hook(event, elapsed, args, None)
+            yield page
+    return instrumented
+
+
+def _patch(cls: type, attr: str, event: str):
+    if (cls, attr) not in _originals:
+        original = vars(cls)[attr]
+        _originals[(cls, attr)] = original
+        wrap = _wrap_pages if inspect.isgeneratorfunction(original) else _wrap
+        setattr(cls, attr, wrap(original, event))
+
+
+def enable():
+    """
+    Start instrumenting Store.checkout (and so Store.order), Store catalog
+    queries, Product.buy and every Promotion.apply_promotion defined so far.
+
+    Instrumentation works by swapping the methods for timed wrappers, so
+    while it is disabled the original methods run untouched.
+    """
+    for attr, event in _STORE_METHODS.items():
+        _patch(Store, attr, event)
+    _patch(Product, "buy", "buy")
+    for cls in _promotion_classes():
+        _patch(cls, "apply_promotion", "apply_promotion")
+
+
+def disable():
+    """
+    Put the original methods back.
+    """
+    while _originals:
+        (cls, attr), original = _originals.popitem()
+        setattr(cls, attr, original)
+
+
+def enabled() -> bool:
+    return bool(_originals)
+
+
+def add_hook(hook: Hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook):
+    _hooks.remove(hook)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total, rows = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            rows.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return rows
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Built-in hook that turns instrumented calls into metrics: latency
+    histograms per operation, order/line/rejection counters, promotion hit
+    rates and low-stock gauges for watched stores.
+    """
+
+    def __init__(self, low_stock_threshold: int = 10):
+        self.low_stock_threshold = low_stock_threshold
+        self._lock = threading.Lock()
+        self.latency: Dict[str, Histogram] = {}
+        self.orders = 0
+        self.order_lines = 0
+        self.rejections: Dict[str, int] = {}
+        self.buys = 0
+        self.promoted_buys = 0
+        self.promotion_applications: Dict[str, int] = {}
+        self._low_stock: Dict[int, Product] = {}
+        self._watched: List[Store] = []
+
+    def __call__(self, event: str, seconds: float, args: tuple,
+                 error: Optional[BaseException]):
+        with self._lock:
+            histogram = self.latency.get(event)
+            if histogram is None:
+                histogram = self.latency[event] = Histogram()
+            histogram.observe(seconds)
+            if event == "order":
+                self.orders += 1
+                self.order_lines += len(args[1])
+                if isinstance(error, ValueError):
+                    reason = str(error)
+                    self.rejections[reason] = self.rejections.get(reason, 0) + 1
+            elif event == "buy" and error is None:
+                self.buys += 1
+                if args[0].promotion is not None:
+                    self.promoted_buys += 1
+            elif event == "apply_promotion" and error is None:
+                name = args[0].name
+                self.promotion_applications[name] = self.promotion_applications.get(name, 0) + 1
+
+    def watch(self, store: Store):
+        """
+        Track products of the store whose stock falls below low_stock_threshold.
+        """
+        with store._lock:
+            store.add_listener(self)
+            self._watched.append(store)
+            for product in store.products:
+                self.product_changed(product)
+
+    def unwatch(self, store: Store):
+        with store._lock:
+            store.remove_listener(self)
+            self._watched.remove(store)
+            for product in store.products:
+                self.product_removed(product)
+
+    def product_added(self, product: Product):
+        self.product_changed(product)
+
+    def product_removed(self, product: Product):
+        with self._lock:
+            self._low_stock.pop(product.product_id, None)
+
+    def product_changed(self, product: Product):
+        low = product.is_active() and product.get_quantity() < self.low_stock_threshold
+        with self._lock:
+            if low:
+                self._low_stock[product.product_id] = product
+            else:
+                self._low_stock.pop(product.product_id, None)
+
+    def snapshot(self) -> Dict:
+        """
+        Return every metric as plain JSON-serializable data.
+        """
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "latency_seconds": {event: {"count": histogram.count, "sum": histogram.sum,
+                                            "buckets": dict(histogram.cumulative())}
+                                    for event, histogram in self.latency.items()},
+                "orders": self.orders,
+                "order_lines": self.order_lines,
+                "rejections": dict(self.rejections),
+                "buys": self.buys,
+                "promoted_buys": self.promoted_buys,
+                "promotion_hit_rate": self.promoted_buys / self.buys if self.buys else 0.0,
+                "promotion_applications": dict(self.promotion_applications),
+                "low_stock": {product.name: product.get_quantity()
+                              for product in self._low_stock.values()},
+            }
+
+    def to_prometheus(self, prefix: str = "bestbuy") -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        data = self.snapshot()
+        lines = [f"# HELP {prefix}_operation_seconds Latency of instrumented operations.",
+                 f"# TYPE {prefix}_operation_seconds histogram"]
+        for event, histogram in data["latency_seconds"].items():
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{prefix}_operation_seconds_bucket{{operation="{event}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_operation_seconds_sum{{operation="{event}"}} {histogram["sum"]}')
+            lines.append(f'{prefix}_operation_seconds_count{{operation="{event}"}} {histogram["count"]}')
+
+        def metric(name: str, kind: str, help_text: str, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{labels} {value}")
+
+        metric("orders_total", "counter", "Orders placed.", [("", data["orders"])])
+        metric("order_lines_total", "counter", "Order lines placed.", [("", data["order_lines"])])
+        metric("orders_rejected_total", "counter", "Orders rejected, by reason.",
+               [(f'{{reason="{_escape(reason)}"}}', count)
+                for reason, count in data["rejections"].items()])
+        metric("buys_total", "counter", "Successful Product.buy calls.", [("", data["buys"])])
+        metric("promoted_buys_total", "counter", "Successful buys of promoted products.",
+               [("", data["promoted_buys"])])
+        metric("promotion_hit_ratio", "gauge", "Share of buys that used a promotion.",
+               [("", data["promotion_hit_rate"])])
+        metric("promotion_applications_total", "counter", "Promotion applications, by promotion.",
+               [(f'{{promotion="{_escape(name)}"}}', count)
+                for name, count in data["promotion_applications"].items()])
+        metric("low_stock_products", "gauge", "Active products below the low-stock threshold.",
+               [("", len(data["low_stock"]))])
+        metric("low_stock_quantity", "gauge", "Quantity of each low-stock product.",
+               [(f'{{product="{_escape(name)}"}}', quantity)
+                for name, quantity in data["low_stock"].items()])
+        return "\n".join(lines) + "\n"
+
+
+class JsonSnapshotWriter:
+    """
+    Appends a JSON snapshot of the metrics to a file every interval seconds.
+    """
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(self.metrics.snapshot()) + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
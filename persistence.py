@@ -0,0 +1,529 @@
+import importlib
+import json
+from array import array
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import promotions
+from products import LOCK_STRIPES, Product, NonStockedProduct, LimitedProduct, \
+    advance_product_ids, locks_for
+from promotions import Promotion
+from store import Store
+
+# Product kinds, numbered like the columnar_store KIND_* constants.
+KIND_STOCKED = 0
+KIND_NON_STOCKED = 1
+KIND_LIMITED = 2
+
+RECORD_ADD = 1
+RECORD_UPDATE = 2
+RECORD_REMOVE = 3
+RECORD_PROMOTION = 4
+RECORD_GROUP = 5
+
+_HEADER = struct.Struct("<BI")
+_CRC = struct.Struct("<I")
+_ADD = struct.Struct("<qbdqbqi")
+_UPDATE = struct.Struct("<qdqbi")
+_REMOVE = struct.Struct("<q")
+_PROMOTION = struct.Struct("<i")
+
+SNAPSHOT_MAGIC = b"BBSNAP01"
+_SNAPSHOT_HEADER = struct.Struct("<8sqqqq")
+
+# Catalog rows: product_id -> [kind, name, price, quantity, active, maximum, promotion_id]
+Rows = Dict[int, list]
+
+
+def product_kind(product: Product) -> Tuple[int, int]:
+    """
+    Return the product's KIND_* constant and its maximum (0 unless limited).
+    """
+    if isinstance(product, NonStockedProduct):
+        return KIND_NON_STOCKED, 0
+    if isinstance(product, LimitedProduct):
+        return KIND_LIMITED, product.maximum
+    return KIND_STOCKED, 0
+
+
+def _wal_path(directory: str, generation: int) -> str:
+    return os.path.join(directory, f"wal-{generation:08d}.log")
+
+
+def _snapshot_path(directory: str) -> str:
+    return os.path.join(directory, "snapshot.bin")
+
+
+def _wal_generations(directory: str) -> List[int]:
+    return sorted(int(name[4:12]) for name in os.listdir(directory)
+                  if name.startswith("wal-") and name.endswith(".log"))
+
+
+def _fsync_directory(directory: str):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def encode_promotion(promotion: Promotion) -> dict:
+    """
+    Describe a promotion as its class (module and qualified name) plus
+    constructor arguments.
+    """
+    cls = type(promotion)
+    return {"module": cls.__module__, "type": cls.__qualname__, "args": promotion.arguments()}
+
+
+def decode_promotion(description: dict) -> Promotion:
+    # Descriptions written before the module was recorded name a class
+    # in promotions.py.
+    cls = importlib.import_module(description.get("module", promotions.__name__))
+    for name in description["type"].split("."):
+        cls = getattr(cls, name)
+    return cls.shared(**description["args"])
+
+
+def _encode(record_type: int, payload: bytes) -> bytes:
+    header = _HEADER.pack(record_type, len(payload))
+    return header + payload + _CRC.pack(zlib.crc32(header + payload))
+
+
+def _decode(data: bytes) -> Tuple[List[Tuple[int, bytes]], int]:
+    records = []
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        record_type, length = _HEADER.unpack_from(data, offset)
+        end = offset + _HEADER.size + length
+        if end + _CRC.size > len(data):
+            break
+        (crc,) = _CRC.unpack_from(data, end)
+        if crc != zlib.crc32(data[offset:end]):
+            break
+        records.append((record_type, data[offset + _HEADER.size:end]))
+        offset = end + _CRC.size
+    return records, offset
+
+
+def read_records(path: str) -> Tuple[List[Tuple[int, bytes]], int]:
+    """
+    Read every intact record of a log file.
+
+    Reading stops at the first torn or corrupt record, which is where a
+    crash interrupted the last write. The records of a group (one order)
+    share a single checksum, so a torn group is dropped as a whole.
+
+    Returns:
+        Tuple: The (record_type, payload) pairs and the byte length of the
+        intact prefix of the file.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    return _decode(data)
+
+
+def _make_product(kind: int, name: str, price: float, quantity: int, active: bool,
+                  maximum: int, product_id: int, promotion: Optional[Promotion]) -> Product:
+    if kind == KIND_NON_STOCKED:
+        product = NonStockedProduct(name, price, product_id=product_id)
+    elif kind == KIND_LIMITED:
+        product = LimitedProduct(name, price, quantity, maximum, product_id=product_id)
+    else:
+        product = Product(name, price, quantity, product_id=product_id)
+    product.active = active
+    product.promotion = promotion
+    return product
+
+
+def replay(records: List[Tuple[int, bytes]], products: Dict[int, Product],
+           promotion_objects: Dict[int, Promotion]):
+    """
+    Apply log records to recovered products and promotions in place.
+    """
+    for record_type, payload in records:
+        if record_type == RECORD_GROUP:
+            replay(_decode(payload)[0], products, promotion_objects)
+        elif record_type == RECORD_UPDATE:
+            product_id, price, quantity, active, promotion_id = _UPDATE.unpack(payload)
+            product = products[product_id]
+            product.price = price
+            product.quantity = quantity
+            product.active = bool(active)
+            product.promotion = promotion_objects.get(promotion_id)
+        elif record_type == RECORD_ADD:
+            product_id, kind, price, quantity, active, maximum, promotion_id = (
+                _ADD.unpack_from(payload))
+            name = payload[_ADD.size:].decode("utf-8")
+            products[product_id] = _make_product(kind, name, price, quantity, bool(active), maximum,
+                                                 product_id, promotion_objects.get(promotion_id))
+        elif record_type == RECORD_REMOVE:
+            products.pop(_REMOVE.unpack(payload)[0], None)
+        elif record_type == RECORD_PROMOTION:
+            (promotion_id,) = _PROMOTION.unpack_from(payload)
+            promotion_objects[promotion_id] = decode_promotion(
+                json.loads(payload[_PROMOTION.size:]))
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot file.
+
+    Columns are exposed as memoryviews straight over the mapping, so
+    opening a snapshot costs nothing until the columns are read.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        magic, self.generation, count, names_size, promotions_size = (
+            _SNAPSHOT_HEADER.unpack_from(view))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot file.")
+        self.count = count
+        offset = _SNAPSHOT_HEADER.size
+
+        def column(fmt: str, itemsize: int, length: int = count):
+            nonlocal offset
+            data = view[offset:offset + itemsize * length].cast(fmt)
+            offset += itemsize * length
+            return data
+
+        self.product_id = column("q", 8)
+        self.price = column("d", 8)
+        self.quantity = column("q", 8)
+        self.maximum = column("q", 8)
+        self.name_offsets = column("q", 8, count + 1)
+        self.promotion = column("i", 4)
+        self.kind = column("b", 1)
+        self.active = column("b", 1)
+        self.names = view[offset:offset + names_size]
+        offset += names_size
+        self.promotions = {int(promotion_id): description for promotion_id, description
+                           in json.loads(bytes(view[offset:offset + promotions_size])).items()}
+
+    def name(self, index: int) -> str:
+        return str(self.names[self.name_offsets[index]:self.name_offsets[index + 1]], "utf-8")
+
+    def products(self, promotion_objects: Dict[int, Promotion]) -> Dict[int, Product]:
+        """
+        Build the snapshot's products straight from the mapped columns.
+        """
+        names = self.names.tobytes()
+        offsets = self.name_offsets.tolist()
+        promotion_of = promotion_objects.get
+        return {product_id: _make_product(kind, names[start:end].decode("utf-8"), price,
+                                          quantity, bool(active), maximum, product_id,
+                                          promotion_of(promotion_id))
+                for product_id, kind, price, quantity, active, maximum, promotion_id, start, end
+                in zip(self.product_id.tolist(), self.kind.tolist(), self.price.tolist(),
+                       self.quantity.tolist(), self.active.tolist(), self.maximum.tolist(),
+                       self.promotion.tolist(), offsets, offsets[1:])}
+
+    def close(self):
+        for attr in ("product_id", "price", "quantity", "maximum", "name_offsets",
+                     "promotion", "kind", "active", "names", "_view"):
+            getattr(self, attr).release()
+        self._mmap.close()
+
+
+def write_snapshot(path: str, generation: int, rows: Rows, promotion_table: Dict[int, dict]):
+    """
+    Write rows to a snapshot file atomically (write, fsync, rename).
+    """
+    ids = list(rows)
+    names = [rows[product_id][1].encode("utf-8") for product_id in ids]
+    offsets = array("q", [0])
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    names_blob = b"".join(names)
+    promotions_blob = json.dumps({str(k): v for k, v in promotion_table.items()}).encode()
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(ids),
+                                      len(names_blob), len(promotions_blob)))
+        f.write(array("q", ids).tobytes())
+        for fmt, field in (("d", 2), ("q", 3), ("q", 5)):
+            f.write(array(fmt, [rows[product_id][field] for product_id in ids]).tobytes())
+        f.write(offsets.tobytes())
+        f.write(array("i", [rows[product_id][6] for product_id in ids]).tobytes())
+        f.write(array("b", [rows[product_id][0] for product_id in ids]).tobytes())
+        f.write(array("b", [rows[product_id][4] for product_id in ids]).tobytes())
+        f.write(names_blob)
+        f.write(promotions_blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_directory(os.path.dirname(path) or ".")
+
+
+def recover(directory: str) -> Tuple[Dict[int, Product], Dict[int, Promotion], int]:
+    """
+    Rebuild the catalog from the latest snapshot and the log written after it.
+
+    Returns:
+        Tuple: The recovered products and promotions by id, and the log
+        generation to continue writing.
+    """
+    products: Dict[int, Product] = {}
+    promotion_objects: Dict[int, Promotion] = {}
+    generation = 0
+    if os.path.exists(_snapshot_path(directory)):
+        snapshot = Snapshot(_snapshot_path(directory))
+        try:
+            promotion_objects = {promotion_id: decode_promotion(description)
+                                 for promotion_id, description in snapshot.promotions.items()}
+            products = snapshot.products(promotion_objects)
+            generation = snapshot.generation
+        finally:
+            snapshot.close()
+    for log_generation in _wal_generations(directory):
+        if log_generation < generation:
+            continue
+        records, intact = read_records(_wal_path(directory, log_generation))
+        replay(records, products, promotion_objects)
+        if intact != os.path.getsize(_wal_path(directory, log_generation)):
+            with open(_wal_path(directory, log_generation), "r+b") as f:
+                f.truncate(intact)
+        generation = log_generation
+    advance_product_ids(max(products, default=0))
+    return products, promotion_objects, generation
+
+
+def build_products(rows: Rows, promotion_table: Dict[int, dict]) -> Tuple[List[Product], Dict[int, Promotion]]:
+    """
+    Turn catalog rows back into Product objects sharing Promotion instances.
+    """
+    promotion_objects = {promotion_id: decode_promotion(description)
+                         for promotion_id, description in promotion_table.items()}
+    advance_product_ids(max(rows, default=0))
+    products = [_make_product(kind, name, price, quantity, active, maximum, product_id,
+                              promotion_objects.get(promotion_id))
+                for product_id, (kind, name, price, quantity, active, maximum, promotion_id)
+                in rows.items()]
+    return products, promotion_objects
+
+
+class Journal:
+    """
+    Append-only write-ahead log of a Store's catalog changes.
+
+    The journal listens to the store and appends one record per added,
+    removed or changed product (changes are logged as the product's new
+    state, so replaying a record twice is harmless). The records of one
+    Store.checkout are appended together as a single group record, so a
+    crash never leaves half an order in the log. Records are buffered
+    and written with a single fsync per group, either every sync_interval
+    seconds by a background thread or as soon as sync_bytes are pending.
+    Callers that need a change to be durable before going on call
+    wait_durable(). Once the current log holds snapshot_bytes, the
+    background thread takes a snapshot, so the log (and the replay after
+    a crash) stays bounded; snapshot_bytes=None turns this off.
+    """
+
+    def __init__(self, directory: str, store: Store, generation: int = 0,
+                 promotion_ids: Optional[Dict[Promotion, int]] = None,
+                 sync_interval: float = 0.005, sync_bytes: int = 1 << 20,
+                 snapshot_bytes: Optional[int] = 64 << 20):
+        self.directory = directory
+        self.store = store
+        self.generation = generation
+        self.sync_interval = sync_interval
+        self.sync_bytes = sync_bytes
+        self.snapshot_bytes = snapshot_bytes
+        self._promotion_ids: Dict[Promotion, int] = dict(promotion_ids or {})
+        self._next_promotion_id = max(self._promotion_ids.values(), default=-1) + 1
+        self._buffer = bytearray()
+        self._appended = 0
+        self._durable = 0
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._io_lock = threading.Lock()
+        self._groups = threading.local()
+        self._file = open(_wal_path(directory, generation), "ab")
+        self._log_bytes = self._file.tell()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        store.add_listener(self)
+
+    def _append(self, record: bytes):
+        group = getattr(self._groups, "records", None)
+        if group is not None:
+            group += record
+            return
+        self._write(record)
+
+    def _write(self, record: bytes):
+        with self._lock:
+            self._buffer += record
+            self._appended += 1
+            if len(self._buffer) >= self.sync_bytes:
+                self._synced.notify_all()
+
+    def _promotion_id(self, promotion: Optional[Promotion]) -> int:
+        if promotion is None:
+            return -1
+        promotion_id = self._promotion_ids.get(promotion)
+        if promotion_id is None:
+            promotion_id = self._next_promotion_id
+            self._next_promotion_id += 1
+            self._promotion_ids[promotion] = promotion_id
+            # Outside any group: other threads may use the id before this
+            # thread's group is appended.
+            self._write(_encode(RECORD_PROMOTION, _PROMOTION.pack(promotion_id)
+                                 + json.dumps(encode_promotion(promotion)).encode()))
+        return promotion_id
+
+    @contextmanager
+    def grouped(self):
+        """
+        Collect the records this thread appends inside the block and
+        append them as one group record when it ends.
+        """
+        if getattr(self._groups, "records", None) is not None:
+            yield
+            return
+        self._groups.records = bytearray()
+        try:
+            yield
+        finally:
+            records, self._groups.records = self._groups.records, None
+            if records:
+                self._write(_encode(RECORD_GROUP, bytes(records)))
+
+    def product_added(self, product: Product):
+        kind, maximum = product_kind(product)
+        promotion_id = self._promotion_id(product.promotion)
+        self._append(_encode(RECORD_ADD, _ADD.pack(
+            product.product_id, kind, product.price, product.get_quantity(),
+            product.is_active(), maximum, promotion_id) + product.name.encode("utf-8")))
+
+    def product_removed(self, product: Product):
+        self._append(_encode(RECORD_REMOVE, _REMOVE.pack(product.product_id)))
+
+    def product_changed(self, product: Product):
+        promotion_id = self._promotion_id(product.promotion)
+        self._append(_encode(RECORD_UPDATE, _UPDATE.pack(
+            product.product_id, product.price, product.get_quantity(),
+            product.is_active(), promotion_id)))
+
+    def sync(self):
+        """
+        Write and fsync every buffered record now.
+        """
+        with self._io_lock:
+            with self._lock:
+                data, self._buffer = self._buffer, bytearray()
+                appended = self._appended
+            if data:
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._log_bytes += len(data)
+            with self._lock:
+                self._durable = max(self._durable, appended)
+                self._synced.notify_all()
+
+    def wait_durable(self):
+        """
+        Block until every record appended so far has been fsynced.
+        """
+        with self._lock:
+            target = self._appended
+            while self._durable < target and not self._closed:
+                self._synced.notify_all()
+                self._synced.wait(self.sync_interval)
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                if len(self._buffer) < self.sync_bytes:
+                    self._synced.wait(self.sync_interval)
+                if self._closed:
+                    return
+            self.sync()
+            if self.snapshot_bytes is not None and self._log_bytes >= self.snapshot_bytes:
+                self.snapshot()
+
+    def snapshot(self):
+        """
+        Write a snapshot of the store and start a new log generation.
+
+        The catalog is copied and the log rotated under every product lock
+        and the store lock, so no order is half done and every change is
+        either in the snapshot or in the new log (or both, which replay
+        tolerates). Older logs are deleted once the snapshot is safely on
+        disk.
+        """
+        with ExitStack() as locks:
+            for lock in locks_for(range(LOCK_STRIPES)):
+                locks.enter_context(lock)
+            locks.enter_context(self.store._lock)
+            rows = {}
+            for product in self.store.products:
+                kind, maximum = product_kind(product)
+                rows[product.product_id] = [kind, product.name, product.price,
+                                            product.get_quantity(), product.is_active(),
+                                            maximum, self._promotion_id(product.promotion)]
+            promotion_table = {promotion_id: encode_promotion(promotion)
+                               for promotion, promotion_id in self._promotion_ids.items()}
+            self.sync()
+            with self._io_lock:
+                self._file.close()
+                self.generation += 1
+                self._file = open(_wal_path(self.directory, self.generation), "ab")
+                self._log_bytes = 0
+        write_snapshot(_snapshot_path(self.directory), self.generation, rows, promotion_table)
+        for generation in _wal_generations(self.directory):
+            if generation < self.generation:
+                os.remove(_wal_path(self.directory, generation))
+
+    def close(self):
+        self.store.remove_listener(self)
+        self.sync()
+        with self._lock:
+            self._closed = True
+            self._synced.notify_all()
+        self._flusher.join()
+        self._file.close()
+
+
+def open_store(directory: str, initial: Optional[Callable[[], Store]] = None,
+               **journal_options) -> Tuple[Store, Journal]:
+    """
+    Open a persistent store, recovering it from disk if it exists.
+
+    Args:
+        directory (str): Directory holding the snapshot and log files.
+        initial: Builds the starting store when the directory holds no data.
+        **journal_options: Passed on to Journal.
+
+    Returns:
+        Tuple[Store, Journal]: The recovered store and its journal.
+    """
+    os.makedirs(directory, exist_ok=True)
+    products, promotion_objects, generation = recover(directory)
+    fresh = not products and not _wal_generations(directory) and not os.path.exists(
+        _snapshot_path(directory))
+    if fresh and initial is not None:
+        store = initial()
+        journal = Journal(directory, store, generation, **journal_options)
+        for product in store.products:
+            journal.product_added(product)
+        journal.sync()
+        return store, journal
+
+    store = Store(list(products.values()))
+    promotion_ids = {promotion: promotion_id
+                     for promotion_id, promotion in promotion_objects.items()}
+    return store, Journal(directory, store, generation, promotion_ids, **journal_options)
@@ -0,0 +1,132 @@
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Type
+from promotions import Promotion, PercentDiscount, SecondHalfPrice, ThirdOneFree
+
+if TYPE_CHECKING:
+    from products import Product
+
+try:
+    import numpy as np
+except ImportError:  # the per-item path still works without NumPy
+    np = None
+
+Kernel = Callable[[List[Promotion], 'np.ndarray', 'np.ndarray', 'np.ndarray'], 'np.ndarray']
+
+_kernels: Dict[Type[Promotion], Kernel] = {}
+_compiled: Dict[Type[Promotion], Optional[Kernel]] = {}
+
+
+def register_kernel(promotion_type: Type[Promotion]):
+    """
+    Register a batch pricing kernel for a promotion class.
+
+    A kernel is called once per batch with every line that uses the
+    promotion type: kernel(promotions, which, prices, quantities), where
+    promotions holds the distinct instances in the batch and which[i] is
+    the index into promotions for line i. It must return the line totals
+    exactly as promotion.apply_promotion would. Promotion classes without
+    a kernel are priced line by line through apply_promotion.
+
+    Args:
+        promotion_type: The Promotion subclass the kernel prices.
+    """
+    def decorator(kernel: Kernel) -> Kernel:
+        _kernels[promotion_type] = kernel
+        _compiled.clear()
+        return kernel
+    return decorator
+
+
+@register_kernel(PercentDiscount)
+def _percent_discount(promotions, which, prices, quantities):
+    percent = np.array([promotion.percent for promotion in promotions], dtype=np.float64)[which]
+    total_price = prices * quantities
+    return total_price - total_price * (percent / 100)
+
+
+@register_kernel(SecondHalfPrice)
+def _second_half_price(promotions, which, prices, quantities):
+    full_price_count = (quantities + 1) // 2
+    half_price_count = quantities // 2
+    return full_price_count * prices + half_price_count * (prices / 2)
+
+
+@register_kernel(ThirdOneFree)
+def _third_one_free(promotions, which, prices, quantities):
+    paid_items = quantities - quantities // 3
+    return paid_items * prices
+
+
+def kernel_for(promotion_type: Type[Promotion]) -> Optional[Kernel]:
+    """
+    Resolve the kernel for a promotion class, or None for the per-item path.
+
+    A kernel registered for a base class is reused only when the subclass
+    does not override apply_promotion, so it cannot silently change prices.
+    """
+    if promotion_type in _compiled:
+        return _compiled[promotion_type]
+    kernel = None
+    if np is not None:
+        for base in promotion_type.__mro__:
+            if base in _kernels:
+                if promotion_type.apply_promotion is base.apply_promotion:
+                    kernel = _kernels[base]
+                break
+    _compiled[promotion_type] = kernel
+    return kernel
+
+
+def price_lines(prices, quantities, promotion_ids, promotions: Sequence[Promotion],
+                product_at: Callable[[int], 'Product']):
+    """
+    Price a batch of order lines.
+
+    Args:
+        prices: Unit price of each line.
+        quantities: Quantity of each line.
+        promotion_ids: Index into promotions for each line, or -1 for none.
+        promotions: The promotions referenced by promotion_ids.
+        product_at: Returns the product of a line, for the per-item path.
+
+    Returns:
+        The total price of each line, as a NumPy array when NumPy is
+        available and as a list otherwise.
+    """
+    if np is None:
+        return [quantity * price if promotion_id < 0
+                else promotions[promotion_id].apply_promotion(product_at(line), quantity)
+                for line, (price, quantity, promotion_id)
+                in enumerate(zip(prices, quantities, promotion_ids))]
+
+    prices = np.asarray(prices, dtype=np.float64)
+    quantities = np.asarray(quantities, dtype=np.int64)
+    promotion_ids = np.asarray(promotion_ids, dtype=np.int64)
+    totals = quantities * prices
+
+    promoted = promotion_ids >= 0
+    if not promoted.any():
+        return totals
+    if (quantities[promoted] <= 0).any():
+        raise ValueError("Quantity must be positive.")
+
+    by_type: Dict[type, List[int]] = {}
+    for promotion_id, promotion in enumerate(promotions):
+        by_type.setdefault(type(promotion), []).append(promotion_id)
+
+    local_ids = np.full(len(promotions), -1, dtype=np.int64)
+    for promotion_type, type_ids in by_type.items():
+        local_ids[type_ids] = np.arange(len(type_ids))
+        lines = np.flatnonzero(promoted & np.isin(promotion_ids, type_ids))
+        if not len(lines):
+            continue
+        kernel = kernel_for(promotion_type)
+        if kernel is not None:
+            instances = [promotions[promotion_id] for promotion_id in type_ids]
+            totals[lines] = kernel(instances, local_ids[promotion_ids[lines]],
+                                   prices[lines], quantities[lines])
+        else:
+            for line in lines.tolist():
+                promotion = promotions[promotion_ids[line]]
+                totals[line] = promotion.apply_promotion(product_at(line),
+                                                         int(quantities[line]))
+    return totals
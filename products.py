@@ -1,14 +1,40 @@
-from typing import Optional
-
-class Promotion:
-    def __init__(self, name: str):
-        self.name = name
-
-    def apply_promotion(self, product, quantity: int) -> float:
-        raise NotImplementedError("Subclasses must implement this method.")
+import itertools
+import sys
+import threading
+from typing import Iterable, List, Optional
+from promotions import Promotion
+
+_product_ids = itertools.count(1)
+
+# Products share a fixed pool of locks, picked by product id, instead of
+# each carrying its own.
+LOCK_STRIPES = 1024
+_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+def new_product_id() -> int:
+    return next(_product_ids)
+
+def advance_product_ids(past: int):
+    """
+    Make sure new_product_id() only hands out ids greater than past.
+    """
+    global _product_ids
+    _product_ids = itertools.count(max(next(_product_ids), past + 1))
+
+def locks_for(product_ids: Iterable[int]) -> List[threading.RLock]:
+    """
+    Return the locks guarding the given products, without duplicates and
+    in the one global order that every multi-product caller must use.
+    """
+    return [_locks[stripe] for stripe in sorted({product_id % LOCK_STRIPES
+                                                 for product_id in product_ids})]
 
 class Product:
-    def __init__(self, name: str, price: float, quantity: int):
+    __slots__ = ("name", "_price", "quantity", "active", "_promotion", "product_id", "_stores",
+                 "_shown")
+
+    def __init__(self, name: str, price: float, quantity: int,
+                 product_id: Optional[int] = None):
         if not name:
             raise ValueError("Product name cannot be empty.")
         if price < 0:
@@ -16,11 +42,54 @@ class Product:
         if quantity < 0:
             raise ValueError("Quantity cannot be negative.")
 
-        self.name = name
-        self.price = price
+        self.name = sys.intern(name)
+        self._price = price
         self.quantity = quantity
         self.active = True
-        self.promotion: Optional[Promotion] = None
+        self._promotion: Optional[Promotion] = None
+        self.product_id = new_product_id() if product_id is None else product_id
+        self._stores = ()
+        self._shown: Optional[str] = None
+
+    @property
+    def _lock(self) -> threading.RLock:
+        return _locks[self.product_id % LOCK_STRIPES]
+
+    def _attach(self, store):
+        self._stores += (store,)
+
+    def _detach(self, store):
+        self._stores = tuple(other for other in self._stores if other is not store)
+
+    def _notify(self):
+        self._shown = None
+        for store in self._stores:
+            store._product_changed(self)
+
+    def _restore(self, quantity: int, active: bool):
+        self.quantity = quantity
+        self.active = active
+        self._notify()
+
+    @property
+    def price(self) -> float:
+        return self._price
+
+    @price.setter
+    def price(self, price: float):
+        if price < 0:
+            raise ValueError("Price cannot be negative.")
+        self._price = price
+        self._notify()
+
+    @property
+    def promotion(self) -> Optional[Promotion]:
+        return self._promotion
+
+    @promotion.setter
+    def promotion(self, promotion: Optional[Promotion]):
+        self._promotion = promotion
+        self._notify()
 
     def get_quantity(self) -> int:
         return self.quantity
@@ -28,20 +97,31 @@ class Product:
     def set_quantity(self, quantity: int):
         if quantity < 0:
             raise ValueError("Quantity can't be negative.")
-        self.quantity = quantity
-        if self.quantity == 0:
-            self.deactivate()
+        with self._lock:
+            self.quantity = quantity
+            if self.quantity == 0:
+                self.deactivate()
+            self._notify()
 
     def is_active(self) -> bool:
         return self.active
 
     def activate(self):
         self.active = True
+        self._notify()
 
     def deactivate(self):
         self.active = False
+        self._notify()
 
     def show(self) -> str:
+        # Cached until the next change to the product; see _notify().
+        shown = self._shown
+        if shown is None:
+            shown = self._shown = self._render()
+        return shown
+
+    def _render(self) -> str:
         promo_info = f"Promotion: {self.promotion.name}" if self.promotion else "No Promotion"
         return f"{self.name}, Price: {self.price}, Quantity: {self.quantity}, {promo_info}"
 
@@ -51,41 +131,51 @@ class Product:
     def set_promotion(self, promotion: Optional[Promotion]):
         self.promotion = promotion
 
-    def buy(self, quantity: int) -> float:
+    def check_buy(self, quantity: int):
         if quantity <= 0:
             raise ValueError("Quantity to buy should be positive.")
         if quantity > self.quantity:
             raise ValueError("Not enough quantity available.")
 
-        if self.promotion:
-            total_price = self.promotion.apply_promotion(self, quantity)
-        else:
-            total_price = quantity * self.price
+    def buy(self, quantity: int) -> float:
+        with self._lock:
+            self.check_buy(quantity)
+
+            if self.promotion:
+                total_price = self.promotion.apply_promotion(self, quantity)
+            else:
+                total_price = quantity * self.price
 
-        self.quantity -= quantity
-        if self.quantity == 0:
-            self.deactivate()
+            self.quantity -= quantity
+            if self.quantity == 0:
+                self.deactivate()
+            self._notify()
 
         return total_price
 
 class NonStockedProduct(Product):
-    def __init__(self, name: str, price: float):
-        super().__init__(name, price, 0)
+    __slots__ = ()
+
+    def __init__(self, name: str, price: float, product_id: Optional[int] = None):
+        super().__init__(name, price, 0, product_id)
 
     def set_quantity(self, quantity: int):
         raise ValueError("Non-stocked products cannot have their quantity set.")
 
-    def buy(self, quantity: int) -> float:
+    def check_buy(self, quantity: int):
         raise ValueError("Non-stocked products cannot be purchased.")
 
 class LimitedProduct(Product):
-    def __init__(self, name: str, price: float, quantity: int, maximum: int):
-        super().__init__(name, price, quantity)
+    __slots__ = ("maximum",)
+
+    def __init__(self, name: str, price: float, quantity: int, maximum: int,
+                 product_id: Optional[int] = None):
+        super().__init__(name, price, quantity, product_id)
         if maximum < 0:
             raise ValueError("Maximum allowed quantity cannot be negative.")
         self.maximum = maximum
 
-    def buy(self, quantity: int) -> float:
+    def check_buy(self, quantity: int):
         if quantity > self.maximum:
             raise ValueError(f"{self.name} can only be ordered with a maximum of {self.maximum} per order.")
-        return super().buy(quantity)
+        super().check_buy(quantity)
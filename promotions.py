@@ -1,18 +1,66 @@
+import inspect
+import sys
+import threading
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 if TYPE_CHECKING:
     from products import Product
 
+# Shared promotions get a small id, their index here. Promotions built
+# directly are not registered, so they are freed with their last product.
+_registry: List['Promotion'] = []
+_registry_lock = threading.Lock()
+_shared: Dict[tuple, 'Promotion'] = {}
+
+def promotion_by_id(promotion_id: int) -> 'Promotion':
+    return _registry[promotion_id]
+
 class Promotion(ABC):
+    __slots__ = ("name", "promotion_id")
+
     def __init__(self, name: str):
-        self.name = name
+        self.name = sys.intern(name)
+        self.promotion_id: Optional[int] = None
+
+    @classmethod
+    def shared(cls, *args, **kwargs) -> 'Promotion':
+        """
+        Return the one shared instance of this promotion with these arguments,
+        creating it on first use. Arguments are matched after binding them to
+        the constructor, so shared("x", 30) and shared("x", percent=30) are
+        the same promotion.
+        """
+        bound = inspect.signature(cls).bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (cls, tuple(bound.arguments.items()))
+        with _registry_lock:
+            promotion = _shared.get(key)
+        if promotion is None:
+            created = cls(*args, **kwargs)
+            with _registry_lock:
+                promotion = _shared.setdefault(key, created)
+                if promotion is created:
+                    promotion.promotion_id = len(_registry)
+                    _registry.append(promotion)
+        return promotion
+
+    def arguments(self) -> dict:
+        """
+        Return the constructor arguments that recreate this promotion.
+        """
+        arguments = {name: getattr(self, name) for cls in type(self).__mro__
+                     for name in getattr(cls, "__slots__", ()) if name != "promotion_id"}
+        arguments.update(getattr(self, "__dict__", {}))
+        return arguments
 
     @abstractmethod
     def apply_promotion(self, product: 'Product', quantity: int) -> float:
         pass
 
 class PercentDiscount(Promotion):
+    __slots__ = ("percent",)
+
     def __init__(self, name: str, percent: float):
         super().__init__(name)
         self.percent = percent
@@ -25,6 +73,8 @@ class PercentDiscount(Promotion):
         return total_price - discount
 
 class SecondHalfPrice(Promotion):
+    __slots__ = ()
+
     def __init__(self, name: str):
         super().__init__(name)
 
@@ -36,6 +86,8 @@ class SecondHalfPrice(Promotion):
         return full_price_count * product.price + half_price_count * (product.price / 2)
 
 class ThirdOneFree(Promotion):
+    __slots__ = ()
+
     def __init__(self, name: str):
         super().__init__(name)
 
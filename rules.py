@@ -0,0 +1,212 @@
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+from products import Product
+from promotions import Promotion
+
+# Rules pick products by product id or, for products that do not exist
+# yet or are recreated on restart, by name.
+Selector = Union[int, str]
+
+
+class ProductCap(NamedTuple):
+    """
+    At most limit units of the product per order, however many lines they are on.
+    """
+    product: Selector
+    limit: int
+
+
+class CategoryCap(NamedTuple):
+    """
+    At most limit units per order across all products of the category.
+    """
+    name: str
+    products: FrozenSet[Selector]
+    limit: int
+
+
+class OncePerOrder(NamedTuple):
+    """
+    The product may be on one line of an order; later lines for it are dropped.
+    """
+    product: Selector
+
+
+class CartMinimum(NamedTuple):
+    """
+    Orders must reach amount (before promotions) and quantity units.
+    """
+    amount: float = 0.0
+    quantity: int = 0
+
+
+class ExclusivePromotion(NamedTuple):
+    """
+    Products on this promotion cannot be ordered together with products on
+    any other promotion. Promotions without this rule stack freely.
+    """
+    promotion: Promotion
+
+
+Rule = Union[ProductCap, CategoryCap, OncePerOrder, CartMinimum, ExclusivePromotion]
+
+DEFAULT_RULES: Tuple[Rule, ...] = (OncePerOrder("Shipping"),)
+
+
+class DroppedLine(NamedTuple):
+    """
+    A line the rules removed from an order; index is its position in the
+    shopping list.
+    """
+    index: int
+    product: Product
+    quantity: int
+    reason: str
+
+
+class Cart(list):
+    """
+    The lines of an order that are left once the rules have dropped
+    repeated once-per-order items, with quantities summed per product.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.quantities: Dict[int, int] = {}
+        self.products: Dict[int, Product] = {}
+        self.subtotal = 0.0
+        self.promotions: Set[Promotion] = set()
+        self.dropped: List[DroppedLine] = []
+
+
+class _Decision(NamedTuple):
+    cap: Optional[int]
+    once: bool
+    categories: Tuple[int, ...]
+
+
+_UNRESTRICTED = _Decision(None, False, ())
+
+
+class RuleEngine:
+    """
+    Evaluates order rules in one pass over a cart.
+
+    The rules are compiled once into a decision per product id: the
+    product's own cap, whether it is once-per-order and which category
+    caps it counts towards. Selectors by name are resolved the first time
+    a product id is seen. The cost of checking a cart depends on its lines
+    and not on how many rules there are.
+
+    LimitedProduct.maximum is always applied as a cap on the whole order,
+    so it cannot be bypassed by repeating a line.
+    """
+
+    def __init__(self, rules: Iterable[Rule] = DEFAULT_RULES):
+        self._caps: Dict[Selector, int] = {}
+        self._once: Set[Selector] = set()
+        self._categories: Dict[Selector, List[int]] = {}
+        self._category_names: List[str] = []
+        self._category_limits: List[int] = []
+        self._minimum_amount = 0.0
+        self._minimum_quantity = 0
+        self._exclusive: Set[Promotion] = set()
+        for rule in rules:
+            if isinstance(rule, ProductCap):
+                self._caps[rule.product] = min(rule.limit, self._caps.get(rule.product, rule.limit))
+            elif isinstance(rule, OncePerOrder):
+                self._once.add(rule.product)
+            elif isinstance(rule, CategoryCap):
+                for product in rule.products:
+                    self._categories.setdefault(product, []).append(len(self._category_names))
+                self._category_names.append(rule.name)
+                self._category_limits.append(rule.limit)
+            elif isinstance(rule, CartMinimum):
+                self._minimum_amount = max(self._minimum_amount, rule.amount)
+                self._minimum_quantity = max(self._minimum_quantity, rule.quantity)
+            elif isinstance(rule, ExclusivePromotion):
+                self._exclusive.add(rule.promotion)
+            else:
+                raise TypeError(f"Unknown order rule {rule!r}.")
+        self._decisions: Dict[int, _Decision] = {}
+
+    def _compile(self, product: Product) -> _Decision:
+        selectors = (product.product_id, product.name)
+        caps = [self._caps[selector] for selector in selectors if selector in self._caps]
+        categories = tuple(sorted({category for selector in selectors
+                                   for category in self._categories.get(selector, ())}))
+        once = any(selector in self._once for selector in selectors)
+        if not caps and not categories and not once:
+            return _UNRESTRICTED
+        return _Decision(min(caps) if caps else None, once, categories)
+
+    def apply(self, shopping_list: Iterable[Tuple[Product, int]]) -> Cart:
+        """
+        Drop repeated once-per-order lines and aggregate the rest. A Cart
+        is returned as it is, since the rules have already been applied.
+
+        Returns:
+            Cart: The lines to order, in their original order.
+        """
+        if isinstance(shopping_list, Cart):
+            return shopping_list
+        cart = Cart()
+        decisions = self._decisions
+        quantities, products = cart.quantities, cart.products
+        track_amount = bool(self._minimum_amount)
+        track_promotions = bool(self._exclusive)
+        for index, (product, quantity) in enumerate(shopping_list):
+            if not isinstance(product, Product):
+                cart.append((product, quantity))
+                continue
+            product_id = product.product_id
+            decision = decisions.get(product_id)
+            if decision is None:
+                decision = decisions[product_id] = self._compile(product)
+            if product_id in quantities and decision.once:
+                cart.dropped.append(DroppedLine(
+                    index, product, quantity, f"{product.name} can only be ordered once per order."))
+                continue
+            cart.append((product, quantity))
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+            products[product_id] = product
+            if track_amount:
+                cart.subtotal += product.price * quantity
+            if track_promotions:
+                promotion = product.promotion
+                if promotion is not None:
+                    cart.promotions.add(promotion)
+        return cart
+
+    def check(self, cart: Cart):
+        """
+        Raises:
+            ValueError: If the cart breaks a rule.
+        """
+        decisions = self._decisions
+        category_totals: Dict[int, int] = {}
+        units = 0
+        for product_id, quantity in cart.quantities.items():
+            units += quantity
+            product = cart.products[product_id]
+            maximum = getattr(product, "maximum", None)
+            if maximum is not None and quantity > maximum:
+                raise ValueError(
+                    f"{product.name} can only be ordered with a maximum of {maximum} per order.")
+            decision = decisions[product_id]
+            if decision.cap is not None and quantity > decision.cap:
+                raise ValueError(
+                    f"{product.name} can only be ordered with a maximum of {decision.cap} per order.")
+            for category in decision.categories:
+                total = category_totals[category] = category_totals.get(category, 0) + quantity
+                if total > self._category_limits[category]:
+                    raise ValueError(f"Only {self._category_limits[category]} "
+                                     f"{self._category_names[category]} can be ordered per order.")
+        if units < self._minimum_quantity:
+            raise ValueError(f"Orders must have at least {self._minimum_quantity} items.")
+        if cart.subtotal < self._minimum_amount:
+            raise ValueError(f"Orders must come to at least {self._minimum_amount} before promotions.")
+        if len(cart.promotions) > 1:
+            for promotion in cart.promotions:
+                if promotion in self._exclusive:
+                    raise ValueError(f"{promotion.name} cannot be combined "
+                                     "with other promotions in one order.")
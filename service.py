@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+import main
+import persistence
+import store
+
+SHUTTING_DOWN = "The order service is shutting down."
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """
+    Return the given percentile (0..1) of a list of samples, or 0.0 if empty.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class OrderCoalescer:
+    """
+    Collects concurrent order requests into micro-batches.
+
+    Requests wait in a bounded queue; when it is full, submit() blocks and
+    the connection stops being read, which pushes back on the client. A
+    single worker drains up to max_batch requests at a time, waiting at
+    most max_delay seconds for a batch to fill, and applies the whole
+    batch in one call on a worker thread so the event loop stays free.
+    With a journal, the batch is only answered once it is on disk, so a
+    whole batch shares one group commit.
+    """
+
+    def __init__(self, store: store.Store, max_batch: int = 256,
+                 max_delay: float = 0.002, max_pending: int = 4096,
+                 journal: Optional[persistence.Journal] = None):
+        self.store = store
+        self.journal = journal
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.batches = 0
+        self.batched_orders = 0
+        self._worker: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    def start(self):
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the worker. A batch that is already being applied is finished;
+        orders still waiting in the queue fail with a ValueError.
+        """
+        self._stopped = True
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            self._fail(future)
+
+    async def submit(self, shopping_list) -> float:
+        if self._stopped:
+            raise ValueError(SHUTTING_DOWN)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((shopping_list, future))
+        if self._stopped:
+            # stop() may have drained the queue while put() was waiting for room.
+            self._fail(future)
+        return await future
+
+    @staticmethod
+    def _fail(future: asyncio.Future):
+        if not future.done():
+            future.set_exception(ValueError(SHUTTING_DOWN))
+
+    def _apply(self, batch) -> List[Tuple[bool, object]]:
+        results = []
+        for shopping_list, _ in batch:
+            try:
+                results.append((True, self.store.checkout(shopping_list)))
+            except Exception as e:
+                # Anything else escaping would kill the worker and leave
+                # every later submit() waiting forever.
+                results.append((False, str(e)))
+        if self.journal is not None:
+            self.journal.wait_durable()
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                deadline = loop.time() + self.max_delay
+                while len(batch) < self.max_batch:
+                    if self.queue.empty():
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        try:
+                            batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                        except asyncio.TimeoutError:
+                            break
+                    else:
+                        batch.append(self.queue.get_nowait())
+
+                applying = loop.run_in_executor(None, self._apply, batch)
+                try:
+                    results = await asyncio.shield(applying)
+                except asyncio.CancelledError:
+                    # The batch is being applied on a thread either way, so
+                    # wait for it and answer its clients before stopping.
+                    self._deliver(batch, await applying)
+                    batch = []
+                    raise
+                self._deliver(batch, results)
+                batch = []
+        finally:
+            for _, future in batch:
+                self._fail(future)
+
+    def _deliver(self, batch, results: List[Tuple[bool, object]]):
+        self.batches += 1
+        self.batched_orders += len(batch)
+        for (_, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(ValueError(value))
+
+
+class OrderService:
+    """
+    Line-protocol front end for a Store.
+
+    Each request is one JSON object per line, for example
+    {"op": "order", "items": [[product_id, quantity], ...]}, and each
+    response is one JSON object per line with "ok", "latency_ms" and
+    either "result" or "error". Supported ops are list, total, quote,
+    order and stats.
+    """
+
+    def __init__(self, store: store.Store, **coalescer_options):
+        self.store = store
+        self.coalescer = OrderCoalescer(store, **coalescer_options)
+        self.latencies: List[float] = []
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> int:
+        """
+        Start listening and return the bound port (useful with port=0).
+        """
+        self.coalescer.start()
+        self._server = await asyncio.start_server(self._handle_client, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+        await self.coalescer.stop()
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    def _shopping_list(self, items) -> list:
+        shopping_list = []
+        for product_id, quantity in items:
+            product = self.store.get_product(int(product_id))
+            if product is None:
+                raise ValueError(f"Unknown product id {product_id}.")
+            if not isinstance(quantity, int) or isinstance(quantity, bool):
+                raise ValueError(f"Quantity must be a whole number, not {quantity!r}.")
+            shopping_list.append((product, quantity))
+        return shopping_list
+
+    async def _dispatch(self, request: Dict):
+        if not isinstance(request, dict):
+            raise ValueError("Requests must be JSON objects.")
+        op = request.get("op")
+        if op == "list":
+            return [{"product_id": product.product_id, "name": product.name,
+                     "price": product.price, "quantity": product.get_quantity(),
+                     "promotion": product.promotion.name if product.promotion else None}
+                    for product in self.store.get_all_products()]
+        if op == "total":
+            return self.store.get_total_quantity()
+        if op == "quote":
+            return self.store.quote(self._shopping_list(request["items"]))
+        if op == "order":
+            return await self.coalescer.submit(self._shopping_list(request["items"]))
+        if op == "stats":
+            return {"requests": self.requests,
+                    "p50_ms": percentile(self.latencies, 0.50),
+                    "p99_ms": percentile(self.latencies, 0.99),
+                    "batches": self.coalescer.batches,
+                    "batched_orders": self.coalescer.batched_orders}
+        raise ValueError(f"Unknown op {op!r}.")
+
+    async def _handle_client(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                started = time.perf_counter()
+                try:
+                    response = {"ok": True,
+                                "result": await self._dispatch(json.loads(line))}
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"ok": False, "error": str(e)}
+                latency = (time.perf_counter() - started) * 1000
+                self.requests += 1
+                self.latencies.append(latency)
+                if len(self.latencies) > 100_000:
+                    del self.latencies[:50_000]
+                response["latency_ms"] = latency
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, data_dir: Optional[str] = None):
+    journal = None
+    if data_dir:
+        best_buy, journal = persistence.open_store(data_dir, initial=main.initialize_store)
+    else:
+        best_buy = main.initialize_store()
+    service = OrderService(best_buy, journal=journal)
+    port = await service.start(host, port)
+    print(f"Best Buy order service listening on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+        if journal is not None:
+            journal.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Best Buy order service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data-dir", help="Serve the persistent store in this directory.")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.data_dir))
+    except KeyboardInterrupt:
+        pass
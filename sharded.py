@@ -0,0 +1,362 @@
+import multiprocessing
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import persistence
+from products import Product
+from promotions import Promotion
+from store import Store
+
+Line = Tuple[Union[int, Product], int]
+
+
+def _row(product: Product, promotion_table: Dict[int, dict],
+         promotion_ids: Dict[Promotion, int]) -> Tuple[int, list]:
+    kind, maximum = persistence.product_kind(product)
+    promotion = product.promotion
+    promotion_id = -1
+    if promotion is not None:
+        promotion_id = promotion_ids.get(promotion)
+        if promotion_id is None:
+            promotion_id = promotion_ids[promotion] = len(promotion_ids)
+            promotion_table[promotion_id] = persistence.encode_promotion(promotion)
+    return product.product_id, [kind, product.name, product.price, product.get_quantity(),
+                                product.is_active(), maximum, promotion_id]
+
+
+class _Shard:
+    """
+    The part of the catalog owned by one worker process.
+
+    Cross-shard orders are run with two-phase commit: prepare() checks the
+    shard's lines and reserves their stock, and finish() either buys the
+    reserved lines (commit) or releases them (abort). Orders that touch
+    only this shard are checked against stock net of reservations and
+    bought straight away; in a batch they run before the prepares, so a
+    cross-shard order that is later aborted cannot reject them.
+    """
+
+    def __init__(self, rows: persistence.Rows, promotion_table: Dict[int, dict]):
+        products, _ = persistence.build_products(rows, promotion_table)
+        self.store = Store(products)
+        self.reserved: Dict[int, int] = {}
+        self.prepared: Dict[int, list] = {}
+
+    def _shopping_list(self, lines: Sequence[Tuple[int, int]]) -> list:
+        shopping_list = []
+        for product_id, quantity in lines:
+            product = self.store.get_product(product_id)
+            if product is None:
+                raise ValueError("Product is not in the store.")
+            shopping_list.append((product, quantity))
+        return self.store.cart(shopping_list)
+
+    def _check(self, shopping_list: list):
+        self.store.check_cart(shopping_list)
+        claimed: Dict[int, int] = {}
+        for product, quantity in shopping_list:
+            claimed[product.product_id] = claimed.get(product.product_id, 0) + quantity
+            reserved = self.reserved.get(product.product_id, 0)
+            if claimed[product.product_id] + reserved > product.get_quantity():
+                raise ValueError("Not enough quantity available.")
+
+    def _release(self, order_id: int) -> list:
+        shopping_list = self.prepared.pop(order_id, [])
+        for product, quantity in shopping_list:
+            left = self.reserved[product.product_id] - quantity
+            if left:
+                self.reserved[product.product_id] = left
+            else:
+                del self.reserved[product.product_id]
+        return shopping_list
+
+    def run(self, orders, prepares):
+        results = {}
+        for order_id, lines in orders:
+            try:
+                shopping_list = self._shopping_list(lines)
+                self._check(shopping_list)
+                results[order_id] = (True, self.store.checkout(shopping_list))
+            except Exception as e:
+                results[order_id] = (False, str(e))
+
+        votes = {}
+        for order_id, lines in prepares:
+            try:
+                shopping_list = self._shopping_list(lines)
+                self._check(shopping_list)
+            except Exception as e:
+                # Any failure is a "no" vote, so the coordinator aborts the
+                # order on the shards that did reserve stock for it.
+                votes[order_id] = str(e)
+                continue
+            self.prepared[order_id] = shopping_list
+            for product, quantity in shopping_list:
+                self.reserved[product.product_id] = (
+                    self.reserved.get(product.product_id, 0) + quantity)
+            votes[order_id] = None
+        return results, votes
+
+    def finish(self, commits, aborts) -> Dict[int, Tuple[bool, object]]:
+        for order_id in aborts:
+            self._release(order_id)
+        results = {}
+        for order_id in commits:
+            try:
+                results[order_id] = (True, self.store.checkout(self._release(order_id)))
+            except Exception as e:
+                results[order_id] = (False, str(e))
+        return results
+
+    def quote(self, lines) -> float:
+        return self.store.quote(self._shopping_list(lines))
+
+    def total_quantity(self) -> int:
+        return self.store.get_total_quantity()
+
+    def rows(self, product_ids: Optional[List[int]] = None):
+        products = (self.store.get_all_products() if product_ids is None
+                    else filter(None, map(self.store.get_product, product_ids)))
+        promotion_table: Dict[int, dict] = {}
+        promotion_ids: Dict[Promotion, int] = {}
+        return (dict(_row(product, promotion_table, promotion_ids) for product in products),
+                promotion_table)
+
+    def add(self, rows, promotion_table):
+        for product in persistence.build_products(rows, promotion_table)[0]:
+            self.store.add_product(product)
+
+    def remove(self, product_id: int):
+        product = self.store.get_product(product_id)
+        if product is None:
+            raise ValueError("Product is not in the store.")
+        self.store.remove_product(product)
+
+
+def _serve(connection, rows: persistence.Rows, promotion_table: Dict[int, dict]):
+    shard = _Shard(rows, promotion_table)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        method, args = message
+        try:
+            connection.send((True, getattr(shard, method)(*args)))
+        except Exception as e:
+            connection.send((False, e))
+    connection.close()
+
+
+class ShardedStore:
+    """
+    A Store whose catalog is split across worker processes by product id.
+
+    Each worker owns the products with product_id % processes equal to its
+    index and talks to this coordinator over a pipe. Orders whose lines all
+    live on one shard are placed there directly; orders spanning shards use
+    two-phase commit, so they are still all-or-nothing. checkout_many sends
+    each shard a single message per phase for a whole batch of orders, which
+    is what lets the shards work in parallel.
+
+    get_all_products and get_product return copies of the products. Order
+    rules are checked by each shard on its part of an order, so cart-level
+    rules (category caps, minimums, exclusive promotions) only see that part.
+    """
+
+    def __init__(self, products: Iterable[Product], processes: int = 2,
+                 start_method: str = "spawn"):
+        self.processes = processes
+        rows: List[persistence.Rows] = [{} for _ in range(processes)]
+        promotion_table: Dict[int, dict] = {}
+        promotion_ids: Dict[Promotion, int] = {}
+        for product in products:
+            product_id, row = _row(product, promotion_table, promotion_ids)
+            rows[product_id % processes][product_id] = row
+
+        context = multiprocessing.get_context(start_method)
+        self._lock = threading.Lock()
+        self._connections = []
+        self._workers = []
+        for shard_rows in rows:
+            parent, child = context.Pipe()
+            worker = context.Process(target=_serve, args=(child, shard_rows, promotion_table),
+                                     daemon=True)
+            worker.start()
+            child.close()
+            self._connections.append(parent)
+            self._workers.append(worker)
+
+    def __enter__(self) -> 'ShardedStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for connection in self._connections:
+            connection.send(None)
+        for worker in self._workers:
+            worker.join()
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+
+    def _shard_of(self, product_id: int) -> int:
+        return product_id % self.processes
+
+    def _exchange(self, calls: Dict[int, Tuple[str, tuple]]) -> Dict[int, Tuple[bool, object]]:
+        """
+        Send one call to each listed shard, then wait for all the answers,
+        so the shards work at the same time.
+
+        Returns:
+            Dict: For each shard, (True, result) or (False, the exception).
+        """
+        with self._lock:
+            for shard, message in calls.items():
+                self._connections[shard].send(message)
+            return {shard: self._connections[shard].recv() for shard in calls}
+
+    def _call(self, calls: Dict[int, Tuple[str, tuple]]) -> Dict[int, object]:
+        """
+        Like _exchange, but raise the first exception a shard sent back.
+        """
+        answers = self._exchange(calls)
+        for ok, value in answers.values():
+            if not ok:
+                raise value
+        return {shard: value for shard, (_, value) in answers.items()}
+
+    def _split(self, shopping_list: Sequence[Line]) -> Dict[int, List[Tuple[int, int]]]:
+        by_shard: Dict[int, List[Tuple[int, int]]] = {}
+        for product, quantity in shopping_list:
+            product_id = product.product_id if isinstance(product, Product) else product
+            by_shard.setdefault(self._shard_of(product_id), []).append((product_id, quantity))
+        return by_shard
+
+    def checkout_many(self, shopping_lists: Sequence[Sequence[Line]]) -> List[Union[float, ValueError]]:
+        """
+        Place a batch of orders.
+
+        Returns:
+            List: For each shopping list, its total price or the ValueError
+            that rejected it. Nothing of a rejected order is bought unless a
+            shard fails to commit after voting yes, which the error says.
+        """
+        orders = {shard: [] for shard in range(self.processes)}
+        prepares = {shard: [] for shard in range(self.processes)}
+        spans: Dict[int, List[int]] = {}  # order id -> shards of a cross-shard order
+        for order_id, shopping_list in enumerate(shopping_lists):
+            by_shard = self._split(shopping_list)
+            if not by_shard:
+                continue
+            if len(by_shard) == 1:
+                (shard, lines), = by_shard.items()
+                orders[shard].append((order_id, lines))
+            else:
+                spans[order_id] = list(by_shard)
+                for shard, lines in by_shard.items():
+                    prepares[shard].append((order_id, lines))
+
+        results: List[Union[float, ValueError]] = [0.0] * len(shopping_lists)
+        try:
+            first = self._call({shard: ("run", (orders[shard], prepares[shard]))
+                                for shard in range(self.processes)
+                                if orders[shard] or prepares[shard]})
+        except Exception:
+            # Some shards may have reserved stock before another failed;
+            # releasing an order a shard never prepared is a no-op.
+            self._call({shard: ("finish", ([], [order_id for order_id, _ in prepares[shard]]))
+                        for shard in range(self.processes) if prepares[shard]})
+            raise
+        votes: Dict[int, Dict[int, Optional[str]]] = {}
+        for shard, (order_results, shard_votes) in first.items():
+            for order_id, (ok, value) in order_results.items():
+                results[order_id] = value if ok else ValueError(value)
+            for order_id, vote in shard_votes.items():
+                votes.setdefault(order_id, {})[shard] = vote
+        if not spans:
+            return results
+
+        commits = {shard: [] for shard in range(self.processes)}
+        aborts = {shard: [] for shard in range(self.processes)}
+        for order_id, shards in spans.items():
+            reasons = [votes[order_id][shard] for shard in shards
+                       if votes[order_id][shard] is not None]
+            if reasons:
+                results[order_id] = ValueError(reasons[0])
+                for shard in shards:
+                    if votes[order_id][shard] is None:
+                        aborts[shard].append(order_id)
+            else:
+                results[order_id] = 0.0
+                for shard in shards:
+                    commits[shard].append(order_id)
+        # A commit can still fail on one shard after others have committed;
+        # such an order is reported as a failure naming the partial commit,
+        # and the rest of the batch is still answered.
+        second = self._exchange({shard: ("finish", (commits[shard], aborts[shard]))
+                                 for shard in range(self.processes)
+                                 if commits[shard] or aborts[shard]})
+        failures: Dict[int, str] = {}
+        committed: Dict[int, int] = {}
+        for shard, (ok, answer) in second.items():
+            if not ok:
+                for order_id in commits[shard]:
+                    failures.setdefault(order_id, str(answer))
+                continue
+            for order_id, (committed_ok, value) in answer.items():
+                if committed_ok:
+                    results[order_id] += value
+                    committed[order_id] = committed.get(order_id, 0) + 1
+                else:
+                    failures.setdefault(order_id, value)
+        for order_id, reason in failures.items():
+            if committed.get(order_id):
+                reason = (f"Order was only partly placed ({committed[order_id]} of "
+                          f"{len(spans[order_id])} shards committed): {reason}")
+            results[order_id] = ValueError(reason)
+        return results
+
+    def checkout(self, shopping_list: Sequence[Line]) -> float:
+        result = self.checkout_many([shopping_list])[0]
+        if isinstance(result, ValueError):
+            raise result
+        return result
+
+    def order(self, shopping_list: Sequence[Line]) -> float:
+        try:
+            return self.checkout(shopping_list)
+        except ValueError as e:
+            print(e)
+            return 0
+
+    def quote(self, shopping_list: Sequence[Line]) -> float:
+        by_shard = self._split(shopping_list)
+        return sum(self._call({shard: ("quote", (lines,))
+                               for shard, lines in by_shard.items()}).values())
+
+    def get_total_quantity(self) -> int:
+        return sum(self._call({shard: ("total_quantity", ())
+                               for shard in range(self.processes)}).values())
+
+    def get_all_products(self) -> List[Product]:
+        products = []
+        for rows, promotion_table in self._call({shard: ("rows", ())
+                                                 for shard in range(self.processes)}).values():
+            products.extend(persistence.build_products(rows, promotion_table)[0])
+        return products
+
+    def get_product(self, product_id: int) -> Optional[Product]:
+        rows, promotion_table = self._call(
+            {self._shard_of(product_id): ("rows", ([product_id],))}).popitem()[1]
+        products, _ = persistence.build_products(rows, promotion_table)
+        return products[0] if products else None
+
+    def add_product(self, product: Product):
+        promotion_table: Dict[int, dict] = {}
+        product_id, row = _row(product, promotion_table, {})
+        self._call({self._shard_of(product_id): ("add", ({product_id: row}, promotion_table))})
+
+    def remove_product(self, product: Union[int, Product]):
+        product_id = product.product_id if isinstance(product, Product) else product
+        self._call({self._shard_of(product_id): ("remove", (product_id,))})
@@ -1,37 +1,530 @@
-from typing import List, Tuple
-from products import Product
+import bisect
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+import pricing
+import rules
+from products import Product, locks_for
+from promotions import Promotion
+
+# Quotes with fewer lines than this are priced item by item, which is
+# several times faster for typical carts than setting up the NumPy kernels;
+# longer shopping lists still go through the batch pricing engine.
+QUOTE_BATCH_LINES = 256
+
+def _snapshot(product: Product) -> tuple:
+    return product.get_quantity(), product.price, product.promotion, product.is_active()
+
+def _index_keys(product: Product, snapshot: tuple) -> Dict[str, tuple]:
+    """
+    Return the key of an active product in each sorted index it belongs to.
+    Every key ends with the product id, so keys are unique.
+    """
+    quantity, price, promotion, active = snapshot
+    if not active:
+        return {}
+    product_id = product.product_id
+    keys = {"active": (product_id,), "price": (price, product_id),
+            "name": (product.name, product_id)}
+    if quantity > 0:
+        keys["in_stock"] = (product_id,)
+    if promotion is not None:
+        keys["promoted"] = (product_id,)
+    return keys
+
+def _index_state(snapshot: tuple) -> tuple:
+    quantity, price, promotion, active = snapshot
+    return active, price, quantity > 0, promotion is not None
+
+class _SortedKeys:
+    """
+    Sorted unique keys kept in buckets of a few hundred keys each, so
+    adding or removing a key moves at most one bucket's worth of entries
+    rather than shifting the whole index.
+    """
+
+    BUCKET = 512
+
+    def __init__(self, keys: Iterable[tuple] = ()):
+        keys = sorted(keys)
+        self._buckets = [keys[i:i + self.BUCKET] for i in range(0, len(keys), self.BUCKET)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+
+    def __iter__(self) -> Iterator[tuple]:
+        for bucket in self._buckets:
+            yield from bucket
+
+    def add(self, key: tuple):
+        buckets, maxes = self._buckets, self._maxes
+        if not buckets:
+            buckets.append([key])
+            maxes.append(key)
+            return
+        i = bisect.bisect_left(maxes, key)
+        if i == len(buckets):
+            i -= 1
+            buckets[i].append(key)
+            maxes[i] = key
+        else:
+            bisect.insort(buckets[i], key)
+        bucket = buckets[i]
+        if len(bucket) > 2 * self.BUCKET:
+            buckets.insert(i + 1, bucket[self.BUCKET:])
+            del bucket[self.BUCKET:]
+            maxes.insert(i, bucket[-1])
+
+    def remove(self, key: tuple):
+        i = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def irange(self, start: tuple, inclusive: bool = True) -> Iterator[tuple]:
+        """
+        Yield the keys from start onwards. The index must not change while
+        the iterator is in use.
+        """
+        find = bisect.bisect_left if inclusive else bisect.bisect_right
+        buckets = self._buckets
+        i = find(self._maxes, start)
+        if i == len(buckets):
+            return
+        bucket = buckets[i]
+        for j in range(find(bucket, start), len(bucket)):
+            yield bucket[j]
+        for i in range(i + 1, len(buckets)):
+            yield from buckets[i]
 
 class Store:
-    def __init__(self, products: List[Product]):
-        self.products = products
+    def __init__(self, products: List[Product], debug: bool = False,
+                 order_rules: Optional[List[rules.Rule]] = None):
+        self.debug = debug
+        self._rules = rules.RuleEngine(rules.DEFAULT_RULES if order_rules is None else order_rules)
+        self._lock = threading.RLock()
+        self._products: Dict[int, Product] = {}
+        self._by_name: Dict[str, Dict[int, Product]] = {}
+        self._active: Dict[int, Product] = {}
+        self._snapshots: Dict[int, tuple] = {}
+        self._total_quantity = 0
+        self._total_value = 0.0
+        self._promotion_quantity: Dict[Promotion, int] = {}
+        # Active products with stock or with a promotion, by product id, for
+        # query() filters; unlike the sorted indexes these are always kept.
+        self._in_stock: Set[int] = set()
+        self._promoted: Set[int] = set()
+        # The sorted indexes behind query(); built by the first query.
+        self._indexes: Optional[Dict[str, _SortedKeys]] = None
+        self._listeners = []
+        for product in products:
+            self.add_product(product)
+
+    @property
+    def products(self) -> List[Product]:
+        return list(self._products.values())
 
     def add_product(self, product: Product):
-        self.products.append(product)
+        with self._lock:
+            product_id = product.product_id
+            if product_id in self._products:
+                raise ValueError(f"A product with id {product_id} is already in the store.")
+            self._products[product_id] = product
+            self._by_name.setdefault(product.name, {})[product_id] = product
+            if product.is_active():
+                self._active[product_id] = product
+            self._snapshots[product_id] = _snapshot(product)
+            self._count(self._snapshots[product_id], 1)
+            self._reindex(product, None, self._snapshots[product_id])
+            product._attach(self)
+            for listener in self._listeners:
+                listener.product_added(product)
+            if self.debug:
+                self.verify_aggregates()
 
     def remove_product(self, product: Product):
-        self.products.remove(product)
+        with self._lock:
+            product_id = product.product_id
+            if self._products.get(product_id) is not product:
+                raise ValueError("Product is not in the store.")
+            del self._products[product_id]
+            same_name = self._by_name[product.name]
+            del same_name[product_id]
+            if not same_name:
+                del self._by_name[product.name]
+            self._active.pop(product_id, None)
+            snapshot = self._snapshots.pop(product_id)
+            self._count(snapshot, -1)
+            self._reindex(product, snapshot, None)
+            product._detach(self)
+            for listener in self._listeners:
+                listener.product_removed(product)
+            if self.debug:
+                self.verify_aggregates()
+
+    def add_listener(self, listener):
+        """
+        Register an object whose product_added, product_removed and
+        product_changed methods are called, under the store lock, after
+        each change to the catalog. A listener may also define grouped(),
+        a context manager that checkout() enters around the changes of one
+        order while it holds the order's product locks.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def get_product(self, product_id: int) -> Optional[Product]:
+        return self._products.get(product_id)
+
+    def get_product_by_name(self, name: str) -> Optional[Product]:
+        same_name = self._by_name.get(name)
+        if not same_name:
+            return None
+        return next(iter(same_name.values()))
+
+    def _count(self, snapshot: tuple, sign: int):
+        quantity, price, promotion, _ = snapshot
+        self._total_quantity += sign * quantity
+        self._total_value += sign * quantity * price
+        if promotion is not None:
+            units = self._promotion_quantity.get(promotion, 0) + sign * quantity
+            if units:
+                self._promotion_quantity[promotion] = units
+            else:
+                self._promotion_quantity.pop(promotion, None)
+
+    def _reindex(self, product: Product, old: Optional[tuple], new: Optional[tuple]):
+        product_id = product.product_id
+        active, _, in_stock, promoted = _index_state(new) if new else (False, None, False, False)
+        if active and in_stock:
+            self._in_stock.add(product_id)
+        else:
+            self._in_stock.discard(product_id)
+        if active and promoted:
+            self._promoted.add(product_id)
+        else:
+            self._promoted.discard(product_id)
+        if self._indexes is None:
+            return
+        old_keys = _index_keys(product, old) if old else {}
+        new_keys = _index_keys(product, new) if new else {}
+        for name, index in self._indexes.items():
+            old_key, new_key = old_keys.get(name), new_keys.get(name)
+            if old_key == new_key:
+                continue
+            if old_key is not None:
+                index.remove(old_key)
+            if new_key is not None:
+                index.add(new_key)
+
+    def _sorted_index(self, name: str) -> _SortedKeys:
+        """
+        Return a sorted index, building all of them with one sort each the
+        first time. Call with the store lock held.
+        """
+        if self._indexes is None:
+            keys: Dict[str, List[tuple]] = {
+                "active": [], "price": [], "name": [], "in_stock": [], "promoted": []}
+            for product in self._active.values():
+                for index_name, key in _index_keys(product, self._snapshots[product.product_id]).items():
+                    keys[index_name].append(key)
+            self._indexes = {index_name: _SortedKeys(index_keys)
+                             for index_name, index_keys in keys.items()}
+        return self._indexes[name]
+
+    def _product_changed(self, product: Product):
+        with self._lock:
+            product_id = product.product_id
+            if self._products.get(product_id) is not product:
+                return  # Removed after the product picked up its stores.
+            if product.is_active():
+                self._active[product_id] = product
+            else:
+                self._active.pop(product_id, None)
+
+            old, new = self._snapshots[product_id], _snapshot(product)
+            if old != new:
+                self._count(old, -1)
+                self._count(new, 1)
+                if _index_state(old) != _index_state(new):
+                    self._reindex(product, old, new)
+                self._snapshots[product_id] = new
+                for listener in self._listeners:
+                    listener.product_changed(product)
+            if self.debug:
+                self.verify_aggregates()
+
+    def verify_aggregates(self):
+        """
+        Recompute every aggregate from the products themselves and raise
+        AssertionError if the incrementally maintained values disagree.
+        """
+        products = self._products.values()
+        total_quantity = sum(product.get_quantity() for product in products)
+        total_value = sum(product.get_quantity() * product.price for product in products)
+        promotion_quantity: Dict[Promotion, int] = {}
+        for product in products:
+            if product.promotion is not None and product.get_quantity():
+                promotion_quantity[product.promotion] = (
+                    promotion_quantity.get(product.promotion, 0) + product.get_quantity())
+        active = {product.product_id for product in products if product.is_active()}
+
+        if total_quantity != self._total_quantity:
+            raise AssertionError(
+                f"Total quantity is {self._total_quantity}, expected {total_quantity}.")
+        if not math.isclose(total_value, self._total_value, rel_tol=1e-9, abs_tol=1e-6):
+            raise AssertionError(
+                f"Total value is {self._total_value}, expected {total_value}.")
+        if promotion_quantity != self._promotion_quantity:
+            raise AssertionError("Per-promotion quantities are out of date.")
+        if active != self._active.keys():
+            raise AssertionError("Active products are out of date.")
+        if self._in_stock != {product_id for product_id in active
+                              if self._products[product_id].get_quantity() > 0}:
+            raise AssertionError("The in_stock set is out of date.")
+        if self._promoted != {product_id for product_id in active
+                              if self._products[product_id].promotion is not None}:
+            raise AssertionError("The promoted set is out of date.")
+        if self._indexes is not None:
+            indexes: Dict[str, List[tuple]] = {name: [] for name in self._indexes}
+            for product in products:
+                for name, key in _index_keys(product, _snapshot(product)).items():
+                    indexes[name].append(key)
+            for name, keys in indexes.items():
+                if sorted(keys) != list(self._indexes[name]):
+                    raise AssertionError(f"The {name} index is out of date.")
 
     def get_total_quantity(self) -> int:
-        return sum(product.get_quantity() for product in self.products)
+        return self._total_quantity
+
+    def get_total_value(self) -> float:
+        return self._total_value
+
+    def get_active_count(self) -> int:
+        return len(self._active)
+
+    def get_inactive_count(self) -> int:
+        return len(self._products) - len(self._active)
+
+    def get_promotion_quantity(self, promotion: Promotion) -> int:
+        return self._promotion_quantity.get(promotion, 0)
 
     def get_all_products(self) -> List[Product]:
-        return [product for product in self.products if product.is_active()]
+        return list(self._active.values())
 
-    def order(self, shopping_list: List[Tuple[Product, int]]) -> float:
-        total_price = 0.0
-        shipping_added = False
+    def query(self, min_price: Optional[float] = None, max_price: Optional[float] = None,
+              in_stock: Optional[bool] = None, promoted: Optional[bool] = None,
+              name_prefix: Optional[str] = None, page_size: int = 20) -> Iterator[List[Product]]:
+        """
+        Lazily list the active products matching every given filter, a page at a time.
+
+        Products come in price order when a price range is given, else in
+        name order when a name prefix is given, else in product id order.
+        Each page is read from a sorted index under the store lock and the
+        next one resumes after the last key seen, so the catalog may change
+        between pages. In product id order no product is listed twice; in
+        price or name order a product whose price or name changes between
+        pages may be listed twice or skipped.
+
+        Args:
+            min_price (float): Lowest price to list, inclusive.
+            max_price (float): Highest price to list, inclusive.
+            in_stock (bool): Only products with (True) or without (False) stock.
+            promoted (bool): Only products with (True) or without (False) a promotion.
+            name_prefix (str): Only products whose name starts with this.
+            page_size (int): Products per page.
+
+        Returns:
+            Iterator[List[Product]]: The pages; the last one may be short.
+        """
+        if page_size <= 0:
+            raise ValueError("Page size must be positive.")
+        if min_price is not None or max_price is not None:
+            index_name, start = "price", (min_price if min_price is not None else -math.inf,)
+            past_end: Callable[[tuple], bool] = lambda key: max_price is not None and key[0] > max_price
+        elif name_prefix:
+            index_name, start = "name", (name_prefix,)
+            past_end = lambda key: not key[0].startswith(name_prefix)
+        elif in_stock:
+            index_name, start, past_end = "in_stock", (), lambda key: False
+        elif promoted:
+            index_name, start, past_end = "promoted", (), lambda key: False
+        else:
+            index_name, start, past_end = "active", (), lambda key: False
+
+        def matches(product: Product) -> bool:
+            product_id = product.product_id
+            return ((min_price is None or product.price >= min_price)
+                    and (max_price is None or product.price <= max_price)
+                    and (in_stock is None or (product_id in self._in_stock) == in_stock)
+                    and (promoted is None or (product_id in self._promoted) == promoted)
+                    and (not name_prefix or product.name.startswith(name_prefix)))
+
+        after = None
+        while True:
+            page = []
+            with self._lock:
+                index = self._sorted_index(index_name)
+                keys = index.irange(start) if after is None else index.irange(after, inclusive=False)
+                finished = True
+                for key in keys:
+                    if past_end(key):
+                        break
+                    if len(page) == page_size:
+                        finished = False
+                        break
+                    after = key
+                    product = self._products[key[-1]]
+                    if matches(product):
+                        page.append(product)
+            if page:
+                yield page
+            if finished:
+                return
+
+    def cart(self, shopping_list: List[Tuple[Product, int]]) -> rules.Cart:
+        """
+        Apply the order rules that drop lines, such as once-per-order items.
+        The returned Cart lists the dropped lines and can be passed to
+        quote() or checkout() in place of the shopping list.
+        """
+        return self._rules.apply(shopping_list)
+
+    def check_cart(self, lines: rules.Cart):
+        """
+        Check a cart against stock and the order rules without buying.
+
+        Raises:
+            ValueError: If checkout() would reject the cart.
+        """
+        claimed: Dict[int, int] = {}
+        for product, quantity in lines:
+            product.check_buy(quantity)
+            already = claimed.get(product.product_id, 0)
+            if already + quantity > product.get_quantity():
+                raise ValueError("Not enough quantity available.")
+            claimed[product.product_id] = already + quantity
+        self._rules.check(lines)
+
+    def quote(self, shopping_list: List[Tuple[Product, int]]) -> float:
+        """
+        Price a shopping list without changing any stock.
+
+        Lines are checked the same way order() would check them, including
+        stock already claimed by earlier lines for the same product. Large
+        shopping lists are priced in one pass through the batch pricing
+        engine, small ones item by item like buy() does.
 
-        for product, quantity in shopping_list:
+        Raises:
+            ValueError: If order() would reject the shopping list.
+        """
+        lines = self.cart(shopping_list)
+        self.check_cart(lines)
+        if len(lines) < QUOTE_BATCH_LINES:
+            total_price = 0.0
+            for product, quantity in lines:
+                promotion = product.promotion
+                total_price += (quantity * product.price if promotion is None
+                                else promotion.apply_promotion(product, quantity))
+            return total_price
+        promotions: List[Promotion] = []
+        promotion_ids: Dict[Promotion, int] = {}
+        line_promotions = []
+        for product, _ in lines:
+            promotion = product.get_promotion()
+            if promotion is None:
+                line_promotions.append(-1)
+            else:
+                if promotion not in promotion_ids:
+                    promotion_ids[promotion] = len(promotions)
+                    promotions.append(promotion)
+                line_promotions.append(promotion_ids[promotion])
+
+        totals = pricing.price_lines([product.price for product, _ in lines],
+                                     [quantity for _, quantity in lines],
+                                     line_promotions, promotions,
+                                     lambda line: lines[line][0])
+        return float(sum(totals))
+
+    def checkout(self, shopping_list: List[Tuple[Product, int]]) -> float:
+        """
+        Buy every line of a shopping list, or none of them.
+
+        The locks of the products involved are taken in their global order,
+        so concurrent orders cannot deadlock or oversell. All lines are checked against
+        the locked stock before any is bought, and if buying still fails
+        part way the stock already taken is put back.
+
+        Returns:
+            float: The total price of the order.
+
+        Raises:
+            ValueError: If any line is invalid; no stock is changed.
+        """
+        lines = self.cart(shopping_list)
+        involved = {product.product_id: product for product, _ in lines}
+        with ExitStack() as locks:
+            for lock in locks_for(involved):
+                locks.enter_context(lock)
+            for listener in tuple(self._listeners):
+                if hasattr(listener, "grouped"):
+                    locks.enter_context(listener.grouped())
+            saved = [(product, product.quantity, product.active)
+                     for product in involved.values()]
+            total_price = 0.0
+            try:
+                self.check_cart(lines)
+                for product, quantity in lines:
+                    total_price += product.buy(quantity)
+            except BaseException:
+                for product, quantity, active in saved:
+                    if (product.quantity, product.active) != (quantity, active):
+                        product._restore(quantity, active)
+                raise
+
+        return total_price
+
+    def checkout_many(self, shopping_lists: List[List[Tuple[Product, int]]]) -> List[Union[float, ValueError]]:
+        """
+        Check out a batch of shopping lists, one after the other.
+
+        Returns:
+            List: For each shopping list, its total price or the ValueError
+            that rejected it (in which case nothing was bought).
+        """
+        results: List[Union[float, ValueError]] = []
+        for shopping_list in shopping_lists:
             try:
-                if isinstance(product, Product) and product.name == "Shipping":
-                    if shipping_added:
-                        print("Shipping can only be ordered once per order.")
-                        continue
-                    else:
-                        shipping_added = True
-                total_price += product.buy(quantity)
+                results.append(self.checkout(shopping_list))
             except ValueError as e:
-                print(e)
-                return 0  # Exit the order processing if there's an invalid quantity
+                results.append(e)
+        return results
+
+    def order(self, shopping_list: List[Tuple[Product, int]]) -> float:
+        try:
+            cart = self.cart(shopping_list)
+            for dropped in cart.dropped:
+                print(dropped.reason)
+            return self.checkout(cart)
+        except ValueError as e:
+            print(e)
+            return 0  # Nothing is bought if any line is invalid
+
+    def order_many(self, shopping_lists: List[List[Tuple[Product, int]]],
+                   max_workers: Optional[int] = None) -> List[float]:
+        """
+        Place many orders concurrently on a thread pool.
 
-        return total_price
\ No newline at end of file
+        Returns:
+            List[float]: The result of order() for each shopping list, in order.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.order, shopping_lists))
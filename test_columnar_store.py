@@ -0,0 +1,95 @@
+import pytest
+np = pytest.importorskip("numpy")
+from products import Product, LimitedProduct, NonStockedProduct
+from promotions import ThirdOneFree
+import columnar_store
+from columnar_store import ColumnarStore
+
+def make_store():
+    macbook = Product("MacBook Air M2", price=1450, quantity=100)
+    earbuds = Product("Bose QuietComfort Earbuds", price=250, quantity=500)
+    earbuds.set_promotion(ThirdOneFree("Third One Free!"))
+    return ColumnarStore([
+        macbook,
+        earbuds,
+        NonStockedProduct("Windows License", price=125),
+        LimitedProduct("Shipping", price=10, quantity=250, maximum=1),
+    ])
+
+def test_views_behave_like_products():
+    """
+    Test that row views support the Product API and write through to the columns.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    assert isinstance(macbook, Product)
+    assert macbook.buy(10) == 14500
+    assert store.get_product(macbook.product_id).get_quantity() == 90
+    assert store.get_total_quantity() == 90 + 500 + 250
+
+    shipping = store.get_product_by_name("Shipping")
+    assert isinstance(shipping, LimitedProduct)
+    with pytest.raises(ValueError, match="maximum of 1"):
+        shipping.buy(2)
+
+    macbook.set_quantity(0)
+    assert macbook not in store.get_all_products()
+
+def test_remove_product_keeps_views_valid():
+    """
+    Test that removing a row does not disturb views of other rows.
+    """
+    store = make_store()
+    shipping = store.get_product_by_name("Shipping")
+    store.remove_product(store.get_product_by_name("MacBook Air M2"))
+    assert len(store) == 3
+    assert shipping.name == "Shipping"
+    assert store.get_product(shipping.product_id) is shipping
+    assert store.get_product_by_name("MacBook Air M2") is None
+
+def test_orders_use_the_store_rows():
+    """
+    Test that ordering the products the store was built from sells its rows,
+    and that products from elsewhere are rejected.
+    """
+    macbook = Product("MacBook Air M2", price=10, quantity=5)
+    store = ColumnarStore([macbook])
+    assert store.order([(macbook, 2)]) == 20
+    assert store.get_total_quantity() == 3
+    with pytest.raises(ValueError, match="not in the store"):
+        store.checkout([(Product("Other", price=1, quantity=1), 1)])
+    assert not hasattr(store.get_product(macbook.product_id), "__dict__")
+
+def test_order_batch():
+    """
+    Test that a batch applies the same checks as Product.buy, line by line.
+    """
+    store = make_store()
+    ids = {product.name: product.product_id for product in store.products}
+    result = store.order_batch(
+        [ids["MacBook Air M2"], ids["Shipping"], ids["Windows License"],
+         ids["MacBook Air M2"], ids["MacBook Air M2"], -1,
+         ids["Bose QuietComfort Earbuds"], ids["Shipping"]],
+        [60, 2, 1, 40, 1, 1, 3, 0])
+    assert result.status.tolist() == [
+        columnar_store.ACCEPTED, columnar_store.OVER_MAXIMUM, columnar_store.NON_STOCKED,
+        columnar_store.ACCEPTED, columnar_store.OUT_OF_STOCK, columnar_store.UNKNOWN_PRODUCT,
+        columnar_store.ACCEPTED, columnar_store.NOT_POSITIVE]
+    assert result.reason(4) == "Not enough quantity available."
+    assert result.total == 100 * 1450 + 2 * 250
+    assert store.get_product(ids["MacBook Air M2"]).get_quantity() == 0
+    assert not store.get_product(ids["MacBook Air M2"]).is_active()
+    assert store.get_product(ids["Bose QuietComfort Earbuds"]).get_quantity() == 497
+
+def test_add_rows():
+    """
+    Test bulk loading rows without building Product objects.
+    """
+    store = ColumnarStore(capacity=2)
+    ids = store.add_rows([f"SKU {i}" for i in range(1000)],
+                         np.full(1000, 2.0), np.arange(1000))
+    assert len(store) == 1000
+    assert store.get_total_quantity() == sum(range(1000))
+    assert store.get_product(int(ids[10])).name == "SKU 10"
+    with pytest.raises(ValueError, match="unique"):
+        store.add_rows(["Again"], [1.0], [1], product_ids=[ids[0]])
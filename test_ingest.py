@@ -0,0 +1,84 @@
+import io
+import json
+from products import Product, LimitedProduct, NonStockedProduct
+from store import Store
+import ingest
+
+def make_store():
+    return Store([
+        Product("MacBook Air M2", price=1450, quantity=10, product_id=1),
+        NonStockedProduct("Windows License", price=125, product_id=2),
+        LimitedProduct("Shipping", price=10, quantity=250, maximum=1, product_id=3),
+    ])
+
+def test_csv_import():
+    """
+    Test that CSV orders are applied and rejections land in the dead-letter file.
+    """
+    store = make_store()
+    source = io.StringIO(
+        "order_id,product_id,quantity\n"
+        "A,1,2\n"
+        "A,Shipping,1\n"
+        "B,3,2\n"
+        "C,2,1\n"
+        "D,1,9\n"
+        "E,99,1\n"
+        "F,1,x\n"
+        "G,1,8\n")
+    dead_letter = io.StringIO()
+    report = ingest.Pipeline(store, dead_letter, batch_size=2).run(ingest.read_csv(source))
+
+    assert report["accepted"] == 2
+    assert report["rejected"] == 5
+    assert report["revenue"] == 2 * 1450 + 10 + 8 * 1450
+    assert store.get_product(1).get_quantity() == 0
+    rejected = [json.loads(line) for line in dead_letter.getvalue().splitlines()]
+    assert {rejection["order_id"]: rejection["reason"] for rejection in rejected} == {
+        "B": "Shipping can only be ordered with a maximum of 1 per order.",
+        "C": "Non-stocked products cannot be purchased.",
+        "D": "Not enough quantity available.",
+        "E": "Unknown product '99'.",
+        "F": "invalid literal for int() with base 10: 'x'",
+    }
+    assert report["stages"]["parse"]["items"] == 7
+    assert report["stages"]["apply"]["items"] == 2
+    assert list(report["stages"]) == ["parse", "validate", "apply"]
+
+def test_dropped_lines_are_dead_lettered(capsys):
+    """
+    Test that lines dropped by the order rules are logged, not printed.
+    """
+    store = make_store()
+    source = io.StringIO("order_id,product_id,quantity\nA,1,1\nA,Shipping,1\nA,Shipping,1\n")
+    dead_letter = io.StringIO()
+    report = ingest.Pipeline(store, dead_letter).run(ingest.read_csv(source))
+
+    assert report["accepted"] == 1
+    assert report["rejected"] == 0
+    assert report["revenue"] == 1450 + 10
+    assert [json.loads(line) for line in dead_letter.getvalue().splitlines()] == [
+        {"order_id": "A", "line": 4, "reason": "Shipping can only be ordered once per order."}]
+    assert capsys.readouterr().out == ""
+
+def test_json_lines_import():
+    """
+    Test JSON Lines orders, including malformed lines.
+    """
+    store = make_store()
+    source = io.StringIO(
+        '{"order_id": "A", "items": [{"product_id": 1, "quantity": 3}, [3, 1]]}\n'
+        '\n'
+        'not json\n'
+        '{"order_id": "B", "items": [{"product": "MacBook Air M2", "quantity": 8}]}\n'
+        '{"order_id": "C", "items": [[1, 2.7]]}\n')
+    dead_letter = io.StringIO()
+    report = ingest.Pipeline(store, dead_letter).run(ingest.read_json_lines(source))
+
+    assert report["accepted"] == 1
+    assert report["rejected"] == 3
+    assert store.get_product(1).get_quantity() == 7
+    reasons = [json.loads(line)["reason"] for line in dead_letter.getvalue().splitlines()]
+    assert reasons[0].startswith("Unparseable order")
+    assert reasons[1] == "Quantity must be a whole number, not 2.7."
+    assert reasons[2] == "Not enough quantity available."
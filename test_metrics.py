@@ -0,0 +1,105 @@
+import json
+import pytest
+from products import Product, LimitedProduct
+from promotions import SecondHalfPrice
+from store import Store
+import metrics
+
+def make_store():
+    macbook = Product("MacBook Air M2", price=1450, quantity=12)
+    macbook.set_promotion(SecondHalfPrice.shared("Second Half price!"))
+    return Store([macbook, LimitedProduct("Shipping", price=10, quantity=5, maximum=1)])
+
+def test_disabled_instrumentation_restores_original_methods():
+    """
+    Test that disabling leaves no wrapper behind on the hot paths.
+    """
+    originals = (Store.checkout, Product.buy, SecondHalfPrice.apply_promotion)
+    metrics.enable()
+    try:
+        assert Store.checkout is not originals[0]
+        assert metrics.enabled()
+    finally:
+        metrics.disable()
+    assert (Store.checkout, Product.buy, SecondHalfPrice.apply_promotion) == originals
+    assert not metrics.enabled()
+
+def test_metrics_recording_and_export(tmp_path):
+    """
+    Test counters, rejections, promotion hits, low stock and both exports.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    shipping = store.get_product_by_name("Shipping")
+    recorder = metrics.Metrics(low_stock_threshold=10)
+    recorder.watch(store)
+    metrics.add_hook(recorder)
+    metrics.enable()
+    try:
+        assert store.order([(macbook, 3), (shipping, 1)]) > 0
+        assert store.order([(shipping, 2)]) == 0
+        store.get_all_products()
+    finally:
+        metrics.disable()
+        metrics.remove_hook(recorder)
+    store.order([(macbook, 1)])
+
+    data = recorder.snapshot()
+    assert data["orders"] == 2
+    assert data["order_lines"] == 3
+    assert data["rejections"] == {"Shipping can only be ordered with a maximum of 1 per order.": 1}
+    assert data["buys"] == 2
+    assert data["promotion_hit_rate"] == 0.5
+    assert data["promotion_applications"] == {"Second Half price!": 1}
+    assert data["low_stock"] == {"MacBook Air M2": 8, "Shipping": 4}
+    assert data["latency_seconds"]["order"]["count"] == 2
+    assert data["latency_seconds"]["get_all_products"]["count"] == 1
+
+    text = recorder.to_prometheus()
+    assert 'bestbuy_operation_seconds_count{operation="order"} 2' in text
+    assert 'bestbuy_operation_seconds_bucket{operation="order",le="+Inf"} 2' in text
+    assert "bestbuy_orders_total 2" in text
+    assert 'bestbuy_low_stock_quantity{product="Shipping"} 4' in text
+
+    writer = metrics.JsonSnapshotWriter(recorder, str(tmp_path / "metrics.jsonl"), interval=60)
+    writer.stop()
+    with open(tmp_path / "metrics.jsonl") as f:
+        assert json.loads(f.readline())["orders"] == 2
+
+def test_columnar_store_orders_are_instrumented():
+    """
+    Test that ColumnarStore orders and quotes go through the timed Store methods.
+    """
+    pytest.importorskip("numpy")
+    from columnar_store import ColumnarStore
+    store = ColumnarStore(make_store().get_all_products())
+    macbook = store.get_product_by_name("MacBook Air M2")
+    recorder = metrics.Metrics()
+    metrics.add_hook(recorder)
+    metrics.enable()
+    try:
+        store.quote([(macbook, 1)])
+        assert store.order([(macbook, 2)]) > 0
+        assert store.checkout_many([[(macbook, 1)]])[0] > 0
+    finally:
+        metrics.disable()
+        metrics.remove_hook(recorder)
+
+    data = recorder.snapshot()
+    assert data["orders"] == 2
+    assert data["latency_seconds"]["quote"]["count"] == 1
+
+def test_query_pages_are_timed():
+    """
+    Test that each page of a catalog query is recorded as one query call.
+    """
+    store = Store([Product(f"Item {i}", price=i, quantity=1) for i in range(5)])
+    recorder = metrics.Metrics()
+    metrics.add_hook(recorder)
+    metrics.enable()
+    try:
+        assert [len(page) for page in store.query(page_size=2)] == [2, 2, 1]
+    finally:
+        metrics.disable()
+        metrics.remove_hook(recorder)
+    assert recorder.snapshot()["latency_seconds"]["query"]["count"] == 3
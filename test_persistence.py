@@ -0,0 +1,230 @@
+import os
+import time
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import PercentDiscount, SecondHalfPrice
+from store import Store
+import persistence
+
+class MemberDiscount(PercentDiscount):
+    """
+    A promotion class defined outside promotions.py.
+    """
+    __slots__ = ()
+
+def initial_store():
+    macbook = Product("MacBook Air M2", price=1450, quantity=100)
+    macbook.set_promotion(SecondHalfPrice("Second Half price!"))
+    windows = NonStockedProduct("Windows License", price=125)
+    windows.set_promotion(PercentDiscount("30% off!", percent=30))
+    return Store([macbook, windows,
+                  LimitedProduct("Shipping", price=10, quantity=250, maximum=1)])
+
+def state(store):
+    return sorted((product.product_id, type(product).__name__, product.name, product.price,
+                   product.get_quantity(), product.is_active(),
+                   getattr(product, "maximum", None),
+                   type(product.promotion).__name__ if product.promotion else None,
+                   product.promotion.arguments() if product.promotion else None)
+                  for product in store.products)
+
+def crash(journal):
+    """
+    Stop the journal like a crash would: nothing buffered after the last sync
+    reaches the disk.
+    """
+    journal.store.remove_listener(journal)
+    with journal._lock:
+        journal._buffer.clear()
+        journal._closed = True
+        journal._synced.notify_all()
+    journal._flusher.join()
+    journal._file.close()
+
+def mutate(store):
+    macbook = store.get_product_by_name("MacBook Air M2")
+    shipping = store.get_product_by_name("Shipping")
+    assert store.order([(macbook, 3), (shipping, 1)]) > 0
+    macbook.set_quantity(40)
+    shipping.set_promotion(PercentDiscount("Free-ish", percent=90))
+    macbook.promotion = None
+    store.add_product(Product("Google Pixel 7", price=500, quantity=250))
+    store.remove_product(store.get_product_by_name("Windows License"))
+    store.get_product_by_name("Google Pixel 7").buy(250)
+
+def test_recover_from_log(tmp_path):
+    """
+    Test that every synced change survives a crash.
+    """
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    mutate(store)
+    journal.wait_durable()
+    expected = state(store)
+    crash(journal)
+
+    recovered, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    assert state(recovered) == expected
+    recovered.verify_aggregates()
+    journal.close()
+
+def test_recover_from_snapshot_and_tail(tmp_path):
+    """
+    Test recovery from a snapshot plus the log written after it, and that
+    older logs are dropped once the snapshot exists.
+    """
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    mutate(store)
+    journal.snapshot()
+    assert os.listdir(tmp_path) and not os.path.exists(tmp_path / "wal-00000000.log")
+    store.get_product_by_name("MacBook Air M2").buy(5)
+    journal.wait_durable()
+    expected = state(store)
+    crash(journal)
+
+    recovered, journal = persistence.open_store(str(tmp_path))
+    assert state(recovered) == expected
+    new = Product("New", price=1, quantity=1)
+    assert new.product_id > max(product.product_id for product in recovered.products)
+    journal.close()
+
+def test_recover_promotion_defined_elsewhere(tmp_path):
+    """
+    Test that promotions of classes from other modules are recovered.
+    """
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    store.get_product_by_name("Shipping").promotion = MemberDiscount("Members", percent=10)
+    journal.snapshot()
+    store.get_product_by_name("MacBook Air M2").promotion = MemberDiscount.shared("VIP", percent=20)
+    journal.wait_durable()
+    expected = state(store)
+    crash(journal)
+
+    recovered, journal = persistence.open_store(str(tmp_path))
+    assert state(recovered) == expected
+    assert type(recovered.get_product_by_name("Shipping").promotion) is MemberDiscount
+    journal.close()
+
+def test_torn_write_is_discarded(tmp_path):
+    """
+    Test that a partially written last record is ignored and truncated.
+    """
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    journal.wait_durable()
+    expected = state(store)
+    journal.close()
+    log = tmp_path / "wal-00000000.log"
+    size = log.stat().st_size
+    with open(log, "ab") as f:
+        f.write(persistence._encode(persistence.RECORD_REMOVE, b"\x01" * 8)[:-3])
+
+    recovered, journal = persistence.open_store(str(tmp_path))
+    assert state(recovered) == expected
+    assert log.stat().st_size == size
+    journal.close()
+
+def test_torn_order_is_dropped_as_a_whole(tmp_path):
+    """
+    Test that the lines of one order reach the log as one group, so a crash
+    part way through writing it replays none of them.
+    """
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    journal.wait_durable()
+    expected = state(store)
+    log = tmp_path / "wal-00000000.log"
+    size = log.stat().st_size
+    macbook = store.get_product_by_name("MacBook Air M2")
+    shipping = store.get_product_by_name("Shipping")
+    assert store.order([(macbook, 3), (shipping, 1)]) > 0
+    journal.wait_durable()
+    crash(journal)
+    with open(log, "rb") as f:
+        f.seek(size)
+        tail = f.read()
+    records, _ = persistence._decode(tail)
+    assert [record_type for record_type, _ in records] == [persistence.RECORD_GROUP]
+    with open(log, "r+b") as f:
+        f.truncate(len(tail) // 2 + size)
+
+    recovered, journal = persistence.open_store(str(tmp_path))
+    assert state(recovered) == expected
+    journal.close()
+
+def test_crash_between_rotation_and_snapshot(tmp_path):
+    """
+    Test that a crash after starting a new log but before the snapshot is
+    written loses nothing.
+    """
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    mutate(store)
+    journal.sync()
+    with journal._io_lock:
+        journal._file.close()
+        journal.generation += 1
+        journal._file = open(persistence._wal_path(str(tmp_path), journal.generation), "ab")
+    store.get_product_by_name("Shipping").buy(1)
+    journal.wait_durable()
+    expected = state(store)
+    crash(journal)
+
+    recovered, journal = persistence.open_store(str(tmp_path))
+    assert state(recovered) == expected
+    journal.close()
+
+def test_log_size_triggers_snapshot(tmp_path):
+    """
+    Test that the journal snapshots and starts a new log once the log is big.
+    """
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store,
+                                            snapshot_bytes=200)
+    macbook = store.get_product_by_name("MacBook Air M2")
+    for _ in range(20):
+        macbook.buy(1)
+    journal.wait_durable()
+    deadline = time.monotonic() + 5
+    while os.path.exists(tmp_path / "wal-00000000.log") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert journal.generation > 0
+    assert os.path.exists(tmp_path / "snapshot.bin")
+    assert not os.path.exists(tmp_path / "wal-00000000.log")
+    expected = state(store)
+    journal.close()
+
+    recovered, journal = persistence.open_store(str(tmp_path))
+    assert state(recovered) == expected
+    journal.close()
+
+def test_group_commit_batches_fsyncs(tmp_path, monkeypatch):
+    """
+    Test that many changes are made durable with far fewer fsyncs.
+    """
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store,
+                                            sync_interval=0.05)
+    fsyncs.clear()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    for _ in range(50):
+        macbook.buy(1)
+    journal.wait_durable()
+    assert 1 <= len(fsyncs) < 50
+    journal.close()
+
+def test_ingest_waits_for_durability_per_batch(tmp_path, monkeypatch):
+    """
+    Test that an import waits for the group commit once per batch before
+    counting its orders as accepted.
+    """
+    import io
+    import ingest
+    store, journal = persistence.open_store(str(tmp_path), initial=initial_store)
+    macbook = store.get_product_by_name("MacBook Air M2")
+    waits = []
+    real_wait = journal.wait_durable
+    monkeypatch.setattr(journal, "wait_durable", lambda: waits.append(journal._appended) or real_wait())
+    source = io.StringIO("product_id,quantity\n" + f"{macbook.product_id},1\n" * 5)
+    report = ingest.Pipeline(store, io.StringIO(), batch_size=2, journal=journal).run(
+        ingest.read_csv(source))
+    assert report["accepted"] == 5
+    assert len(waits) == 3
+    assert journal._durable == journal._appended
+    journal.close()
@@ -0,0 +1,87 @@
+import random
+import pytest
+np = pytest.importorskip("numpy")
+from products import Product
+from promotions import Promotion, PercentDiscount, SecondHalfPrice, ThirdOneFree
+import pricing
+
+class BuyOneGetOneFree(Promotion):
+    def apply_promotion(self, product, quantity: int) -> float:
+        return ((quantity + 1) // 2) * product.price
+
+class HalfOff(PercentDiscount):
+    def apply_promotion(self, product, quantity: int) -> float:
+        return super().apply_promotion(product, quantity) - 1
+
+def per_item_totals(products, quantities):
+    totals = []
+    for product, quantity in zip(products, quantities):
+        promotion = product.get_promotion()
+        if promotion:
+            totals.append(promotion.apply_promotion(product, quantity))
+        else:
+            totals.append(quantity * product.price)
+    return totals
+
+def price_products(products, quantities):
+    promotions = []
+    promotion_ids = []
+    for product in products:
+        promotion = product.get_promotion()
+        if promotion is None:
+            promotion_ids.append(-1)
+        else:
+            if promotion not in promotions:
+                promotions.append(promotion)
+            promotion_ids.append(promotions.index(promotion))
+    return pricing.price_lines([product.price for product in products], quantities,
+                               promotion_ids, promotions, lambda line: products[line])
+
+def test_kernels_match_per_item_pricing():
+    """
+    Test that batch pricing gives exactly the per-item results.
+    """
+    rng = random.Random(7)
+    promotions = [None, PercentDiscount("30% off!", percent=30),
+                  PercentDiscount("12.5% off", percent=12.5), SecondHalfPrice("Half"),
+                  ThirdOneFree("Free"), BuyOneGetOneFree("BOGO"), HalfOff("Half off", 50)]
+    products = []
+    for i in range(2000):
+        product = Product(f"SKU {i}", price=rng.choice([rng.randint(0, 2000),
+                                                        round(rng.uniform(0, 999), 2)]),
+                          quantity=100)
+        product.set_promotion(rng.choice(promotions))
+        products.append(product)
+    quantities = [rng.randint(1, 100) for _ in products]
+
+    assert price_products(products, quantities).tolist() == per_item_totals(products, quantities)
+
+def test_kernel_resolution():
+    """
+    Test that only promotions with an unchanged apply_promotion reuse a kernel.
+    """
+    class RenamedDiscount(PercentDiscount):
+        pass
+
+    assert pricing.kernel_for(RenamedDiscount) is pricing.kernel_for(PercentDiscount)
+    assert pricing.kernel_for(HalfOff) is None
+    assert pricing.kernel_for(BuyOneGetOneFree) is None
+
+    @pricing.register_kernel(BuyOneGetOneFree)
+    def bogo(promotions, which, prices, quantities):
+        return ((quantities + 1) // 2) * prices
+
+    try:
+        assert pricing.kernel_for(BuyOneGetOneFree) is bogo
+    finally:
+        del pricing._kernels[BuyOneGetOneFree]
+        pricing._compiled.clear()
+
+def test_non_positive_quantity_rejected():
+    """
+    Test that promoted lines reject non-positive quantities like apply_promotion.
+    """
+    product = Product("Test Product", price=10.0, quantity=10)
+    product.set_promotion(ThirdOneFree("Free"))
+    with pytest.raises(ValueError, match="Quantity must be positive."):
+        price_products([product], [0])
@@ -1,5 +1,7 @@
 import pytest
-from products import Product  # Adjust the import according to your directory structure
+from products import Product, LimitedProduct  # Adjust the import according to your directory structure
+import promotions
+from promotions import PercentDiscount, SecondHalfPrice, promotion_by_id
 
 def test_creating_product():
     """
@@ -50,5 +52,52 @@ def test_buy_too_much():
     with pytest.raises(ValueError, match="Not enough quantity available."):
         product.buy(20)
 
+def test_products_have_no_instance_dict():
+    """
+    Test that products use __slots__ and keep their public attributes.
+    """
+    product = LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    assert not hasattr(product, "__dict__")
+    assert (product.name, product.price, product.quantity, product.maximum) == ("Shipping", 10, 250, 1)
+    assert product.promotion is None
+
+def test_shared_promotions():
+    """
+    Test that shared promotions are registered flyweights and that other
+    promotions are freed with their last product.
+    """
+    half = SecondHalfPrice.shared("Second Half price!")
+    assert SecondHalfPrice.shared("Second Half price!") is half
+    assert PercentDiscount.shared("30% off!", percent=30) is not PercentDiscount.shared("30% off!", percent=20)
+    assert PercentDiscount.shared("30% off!", 30) is PercentDiscount.shared(name="30% off!", percent=30)
+    assert promotion_by_id(half.promotion_id) is half
+
+    product = Product("Test Product", price=10.0, quantity=100)
+    product.set_promotion(half)
+    assert product.get_promotion() is half
+    assert product.buy(2) == 15.0
+    assert PercentDiscount("30% off!", percent=30).arguments() == {"name": "30% off!", "percent": 30}
+
+    registered = len(promotions._registry)
+    one_off = PercentDiscount("One off", percent=5)
+    product.set_promotion(one_off)
+    assert product.promotion is one_off
+    assert one_off.promotion_id is None
+    assert len(promotions._registry) == registered
+
+def test_show_is_cached_until_product_changes():
+    """
+    Test that show() reuses its string until price, quantity or promotion change.
+    """
+    product = Product("Test Product", price=10.0, quantity=100)
+    shown = product.show()
+    assert product.show() is shown
+    product.buy(1)
+    assert product.show() == "Test Product, Price: 10.0, Quantity: 99, No Promotion"
+    product.price = 12.0
+    assert "Price: 12.0" in product.show()
+    product.promotion = SecondHalfPrice.shared("Second Half price!")
+    assert product.show().endswith("Promotion: Second Half price!")
+
 if __name__ == "__main__":
     pytest.main()
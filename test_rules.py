@@ -0,0 +1,66 @@
+import pytest
+import main
+from products import Product, LimitedProduct
+from promotions import PercentDiscount, SecondHalfPrice
+from rules import CartMinimum, CategoryCap, ExclusivePromotion, OncePerOrder, ProductCap
+from store import Store
+
+
+def test_default_rules_keep_current_catalog_behaviour(capsys):
+    """
+    Test that the default rules order the main catalog exactly as before.
+    """
+    store = main.initialize_store()
+    macbook, earbuds, pixel, windows, shipping = store.products
+    assert store.order([(macbook, 3), (shipping, 1), (shipping, 1)]) == 1450 * 2 + 725 + 10
+    assert capsys.readouterr().out == "Shipping can only be ordered once per order.\n"
+    assert store.order([(earbuds, 3), (pixel, 1), (shipping, 1)]) == 500 + 500 + 10
+    assert store.order([(shipping, 2)]) == 0
+    assert capsys.readouterr().out == "Shipping can only be ordered with a maximum of 1 per order.\n"
+    assert store.order([(windows, 1), (shipping, 1)]) == 0
+    assert capsys.readouterr().out == "Non-stocked products cannot be purchased.\n"
+    assert store.get_total_quantity() == 1100 - 4 - 5
+
+
+def test_caps_apply_to_the_whole_order():
+    """
+    Test that repeating a line cannot get around a product or category cap.
+    """
+    phone = LimitedProduct("Phone", price=500, quantity=50, maximum=2)
+    case = Product("Case", price=20, quantity=50)
+    cable = Product("Cable", price=5, quantity=50)
+    store = Store([phone, case, cable], order_rules=[
+        ProductCap(case.product_id, 3),
+        CategoryCap("accessories", frozenset({"Case", "Cable"}), 4)])
+    with pytest.raises(ValueError, match="Phone can only be ordered with a maximum of 2"):
+        store.checkout([(phone, 1), (phone, 1), (phone, 1)])
+    with pytest.raises(ValueError, match="Case can only be ordered with a maximum of 3"):
+        store.checkout([(case, 2), (case, 2)])
+    with pytest.raises(ValueError, match="Only 4 accessories can be ordered per order."):
+        store.checkout([(case, 3), (cable, 2)])
+    assert store.checkout([(phone, 1), (phone, 1), (case, 3), (cable, 1)]) == 1000 + 60 + 5
+    assert store.get_total_quantity() == 150 - 6
+
+
+def test_cart_minimum_and_exclusive_promotions(capsys):
+    """
+    Test cart-level minimums, once-per-order items and exclusive promotions.
+    """
+    half = SecondHalfPrice.shared("Second Half price!")
+    clearance = PercentDiscount.shared("Clearance", percent=50)
+    tv = Product("TV", price=400, quantity=10)
+    radio = Product("Radio", price=40, quantity=10)
+    gift = Product("Gift wrap", price=2, quantity=10)
+    tv.set_promotion(half)
+    radio.set_promotion(clearance)
+    store = Store([tv, radio, gift], order_rules=[
+        CartMinimum(amount=50), OncePerOrder(gift.product_id), ExclusivePromotion(clearance)])
+    with pytest.raises(ValueError, match="at least 50"):
+        store.quote([(radio, 1), (gift, 1)])
+    with pytest.raises(ValueError, match="Clearance cannot be combined"):
+        store.quote([(tv, 1), (radio, 2)])
+    cart = store.cart([(radio, 2), (gift, 1), (gift, 1)])
+    assert cart.dropped == [(2, gift, 1, "Gift wrap can only be ordered once per order.")]
+    assert store.quote(cart) == 40 + 2
+    assert capsys.readouterr().out == ""
+    assert store.order([(tv, 2), (gift, 1)]) == 600 + 2
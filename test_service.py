@@ -0,0 +1,111 @@
+import asyncio
+import json
+from products import Product, NonStockedProduct
+from store import Store
+from service import OrderCoalescer, OrderService, SHUTTING_DOWN
+
+async def exchange(port, requests):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = []
+    for request in requests:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        responses.append(json.loads(await reader.readline()))
+    writer.close()
+    return responses
+
+def test_service_round_trip():
+    """
+    Test the list, total, quote, order and stats operations end to end.
+    """
+    pixel = Product("Google Pixel 7", price=500, quantity=250)
+    windows = NonStockedProduct("Windows License", price=125)
+
+    async def scenario():
+        service = OrderService(Store([pixel, windows]))
+        port = await service.start(port=0)
+        try:
+            listed, total, quote, order, rejected, unknown = await exchange(port, [
+                {"op": "list"},
+                {"op": "total"},
+                {"op": "quote", "items": [[pixel.product_id, 2]]},
+                {"op": "order", "items": [[pixel.product_id, 2]]},
+                {"op": "order", "items": [[pixel.product_id, 1], [windows.product_id, 1]]},
+                {"op": "refund"},
+            ])
+            concurrent = await asyncio.gather(*(
+                exchange(port, [{"op": "order", "items": [[pixel.product_id, 1]]}])
+                for _ in range(20)))
+            stats = (await exchange(port, [{"op": "stats"}]))[0]
+        finally:
+            await service.stop()
+        return listed, total, quote, order, rejected, unknown, concurrent, stats
+
+    listed, total, quote, order, rejected, unknown, concurrent, stats = asyncio.run(scenario())
+    assert [product["name"] for product in listed["result"]] == ["Google Pixel 7", "Windows License"]
+    assert total["result"] == 250
+    assert quote["result"] == order["result"] == 1000
+    assert rejected == {"ok": False, "error": "Non-stocked products cannot be purchased.",
+                        "latency_ms": rejected["latency_ms"]}
+    assert not unknown["ok"]
+    assert all(response[0]["result"] == 500 for response in concurrent)
+    assert pixel.get_quantity() == 250 - 2 - 20
+    assert stats["result"]["batched_orders"] == 22
+    assert stats["result"]["batches"] < 22
+    assert stats["result"]["p99_ms"] >= stats["result"]["p50_ms"] > 0
+
+
+def test_coalescer_stop_fails_queued_orders():
+    """
+    Test that stopping the coalescer answers every order still waiting in its queue.
+    """
+    pixel = Product("Google Pixel 7", price=500, quantity=250)
+
+    async def scenario():
+        coalescer = OrderCoalescer(Store([pixel]))
+        waiting = [asyncio.ensure_future(coalescer.submit([(pixel, 1)])) for _ in range(3)]
+        await asyncio.sleep(0)
+        await coalescer.stop()
+        late = asyncio.ensure_future(coalescer.submit([(pixel, 1)]))
+        return await asyncio.gather(*waiting, late, return_exceptions=True)
+
+    results = asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert [str(result) for result in results] == [SHUTTING_DOWN] * 4
+    assert pixel.get_quantity() == 250
+
+
+def test_malformed_requests_are_answered():
+    """
+    Test that non-object requests, fractional quantities and unexpected
+    errors while ordering get an error response and leave the service working.
+    """
+    pixel = Product("Google Pixel 7", price=500, quantity=250)
+    broken = Product("Broken", price=1, quantity=5)
+    store = Store([pixel, broken])
+    real_checkout = store.checkout
+
+    def checkout(shopping_list):
+        if shopping_list[0][0] is broken:
+            raise RuntimeError("disk on fire")
+        return real_checkout(shopping_list)
+    store.checkout = checkout
+
+    async def scenario():
+        service = OrderService(store)
+        port = await service.start(port=0)
+        try:
+            return await exchange(port, [
+                [1, 2],
+                {"op": "order", "items": [[pixel.product_id, 2.7]]},
+                {"op": "order", "items": [[broken.product_id, 1]]},
+                {"op": "order", "items": [[pixel.product_id, 2]]},
+            ])
+        finally:
+            await service.stop()
+
+    not_object, fractional, failed, order = asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert not_object["error"] == "Requests must be JSON objects."
+    assert not fractional["ok"] and "whole number" in fractional["error"]
+    assert failed == {"ok": False, "error": "disk on fire", "latency_ms": failed["latency_ms"]}
+    assert order["result"] == 1000
+    assert pixel.get_quantity() == 248
@@ -0,0 +1,103 @@
+import pytest
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import PercentDiscount, SecondHalfPrice
+from sharded import ShardedStore
+
+
+class FailingPromotion(SecondHalfPrice):
+    """
+    A promotion that passes the prepare phase but fails when bought.
+    """
+    __slots__ = ()
+
+    def apply_promotion(self, product, quantity):
+        raise TypeError("Pricing failed.")
+
+
+@pytest.fixture
+def catalog():
+    macbook = Product("MacBook Air M2", price=1450, quantity=100)
+    earbuds = Product("Bose QuietComfort Earbuds", price=250, quantity=500)
+    pixel = LimitedProduct("Google Pixel 7", price=500, quantity=250, maximum=2)
+    windows = NonStockedProduct("Windows License", price=125)
+    earbuds.promotion = PercentDiscount.shared("30% off!", percent=30)
+    return [macbook, earbuds, pixel, windows]
+
+
+def test_sharded_aggregates_and_orders(catalog):
+    """
+    Test that shard aggregates are combined and single-shard and
+    cross-shard orders are priced like a local Store would.
+    """
+    macbook, earbuds, pixel, windows = catalog
+    with ShardedStore(catalog, processes=2) as store:
+        assert store.get_total_quantity() == 850
+        assert sorted(p.name for p in store.get_all_products()) == sorted(p.name for p in catalog)
+        assert store.quote([(macbook, 1), (earbuds, 2)]) == 1450 + 350
+        assert store.checkout([(macbook, 1), (earbuds, 2)]) == 1450 + 350
+        assert store.checkout([(pixel.product_id, 2)]) == 1000
+        assert store.get_total_quantity() == 845
+        assert store.get_product(earbuds.product_id).get_quantity() == 498
+        assert store.get_product(earbuds.product_id).promotion.name == "30% off!"
+
+
+def test_cross_shard_order_is_all_or_nothing(catalog):
+    """
+    Test that a cross-shard order rejected by one shard buys nothing on the others.
+    """
+    macbook, earbuds, pixel, windows = catalog
+    with ShardedStore(catalog, processes=4) as store:
+        results = store.checkout_many([[(macbook, 1), (earbuds, 1), (pixel, 3)],
+                                       [(macbook, 1), (earbuds, 501)],
+                                       [(earbuds, 1), (windows, 1)],
+                                       [(macbook, 99)]])
+        assert str(results[0]) == "Google Pixel 7 can only be ordered with a maximum of 2 per order."
+        assert str(results[1]) == "Not enough quantity available."
+        assert str(results[2]) == "Non-stocked products cannot be purchased."
+        assert results[3] == 99 * 1450
+        assert store.get_total_quantity() == 751
+        assert store.order([(earbuds, 1), (macbook, 2)]) == 0
+        assert store.get_total_quantity() == 751
+
+
+
+def test_failed_prepare_releases_reservations(catalog):
+    """
+    Test that an unexpected error on one shard aborts the order on the others.
+    """
+    macbook, earbuds, pixel, windows = catalog
+    with ShardedStore(catalog, processes=4) as store:
+        result, = store.checkout_many([[(macbook, 100), (earbuds, "x")]])
+        assert isinstance(result, ValueError)
+        assert store.checkout([(macbook, 100)]) == 100 * 1450
+        assert store.get_total_quantity() == 750
+
+
+def test_failed_commit_is_reported_per_order(catalog):
+    """
+    Test that a shard failing to commit after voting yes fails only that
+    order, says it was partly placed, and the rest of the batch is answered.
+    """
+    macbook, earbuds, pixel, windows = catalog
+    earbuds.promotion = FailingPromotion("Broken")
+    with ShardedStore(catalog, processes=4) as store:
+        results = store.checkout_many([[(macbook, 1), (earbuds, 1)],
+                                       [(macbook, 1), (pixel, 1)]])
+        assert "only partly placed" in str(results[0])
+        assert "Pricing failed." in str(results[0])
+        assert results[1] == 1450 + 500
+        assert store.get_total_quantity() == 850 - 3
+
+def test_sharded_catalog_changes(catalog):
+    """
+    Test adding and removing products on their owning shard.
+    """
+    macbook = catalog[0]
+    extra = Product("Keyboard", price=50, quantity=10)
+    with ShardedStore(catalog, processes=3) as store:
+        store.add_product(extra)
+        store.remove_product(macbook)
+        assert store.get_total_quantity() == 760
+        assert store.get_product(macbook.product_id) is None
+        with pytest.raises(ValueError):
+            store.checkout([(macbook, 1)])
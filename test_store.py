@@ -0,0 +1,288 @@
+import random
+import sys
+import pytest
+from products import Product, LimitedProduct, NonStockedProduct
+from promotions import SecondHalfPrice
+from store import Store
+
+def make_store():
+    return Store([
+        Product("MacBook Air M2", price=1450, quantity=100),
+        Product("Google Pixel 7", price=500, quantity=2),
+        NonStockedProduct("Windows License", price=125),
+        LimitedProduct("Shipping", price=10, quantity=250, maximum=1),
+    ])
+
+def test_lookup_by_id_and_name():
+    """
+    Test that products can be looked up by their id and by their name.
+    """
+    store = make_store()
+    pixel = store.get_product_by_name("Google Pixel 7")
+    assert pixel is not None
+    assert store.get_product(pixel.product_id) is pixel
+    assert store.get_product_by_name("Missing") is None
+
+def test_remove_product():
+    """
+    Test that a removed product disappears from every view of the store.
+    """
+    store = make_store()
+    pixel = store.get_product_by_name("Google Pixel 7")
+    store.remove_product(pixel)
+    assert pixel not in store.products
+    assert pixel not in store.get_all_products()
+    assert store.get_product(pixel.product_id) is None
+    with pytest.raises(ValueError, match="Product is not in the store."):
+        store.remove_product(pixel)
+
+def test_duplicate_product_id():
+    """
+    Test that two products sharing an id cannot be added to one store.
+    """
+    store = make_store()
+    with pytest.raises(ValueError, match="already in the store"):
+        store.add_product(Product("Clone", price=1, quantity=1,
+                                  product_id=store.products[0].product_id))
+
+def test_active_products_follow_product_state():
+    """
+    Test that the active product view tracks buying and (de)activation.
+    """
+    store = make_store()
+    pixel = store.get_product_by_name("Google Pixel 7")
+    pixel.buy(2)
+    assert pixel not in store.get_all_products()
+    pixel.set_quantity(5)
+    pixel.activate()
+    assert pixel in store.get_all_products()
+    pixel.deactivate()
+    assert pixel not in store.get_all_products()
+    assert len(store.get_all_products()) == 3
+
+def test_aggregates_follow_changes():
+    """
+    Test that the running inventory aggregates match a full recompute.
+    """
+    store = make_store()
+    store.debug = True
+    half = SecondHalfPrice("Second Half price!")
+    macbook = store.get_product_by_name("MacBook Air M2")
+    macbook.set_promotion(half)
+    assert store.get_total_quantity() == 352
+    assert store.get_promotion_quantity(half) == 100
+
+    macbook.buy(10)
+    store.get_product_by_name("Google Pixel 7").buy(2)
+    macbook.price = 1000
+    store.add_product(Product("Bose QuietComfort Earbuds", price=250, quantity=500))
+    store.remove_product(store.get_product_by_name("Shipping"))
+
+    assert store.get_total_quantity() == 590
+    assert store.get_total_value() == 90 * 1000 + 500 * 250
+    assert store.get_promotion_quantity(half) == 90
+    assert store.get_active_count() == 3
+    assert store.get_inactive_count() == 1
+    store.verify_aggregates()
+
+def test_verify_aggregates_detects_drift():
+    """
+    Test that changes made behind the store's back are caught.
+    """
+    store = make_store()
+    store.products[0].quantity = 1
+    with pytest.raises(AssertionError, match="Total quantity"):
+        store.verify_aggregates()
+
+def test_quote_does_not_change_stock():
+    """
+    Test that quoting prices a cart like order() without touching stock.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    macbook.set_promotion(SecondHalfPrice("Second Half price!"))
+    shipping = store.get_product_by_name("Shipping")
+    cart = [(macbook, 3), (shipping, 1), (shipping, 1)]
+    assert store.quote(cart) == 1450 * 2 + 725 + 10
+    assert store.get_total_quantity() == 352
+
+    with pytest.raises(ValueError, match="Not enough quantity available."):
+        store.quote([(macbook, 60), (macbook, 41)])
+    with pytest.raises(ValueError, match="Non-stocked products cannot be purchased."):
+        store.quote([(store.get_product_by_name("Windows License"), 1)])
+    assert store.order(cart) == 1450 * 2 + 725 + 10
+
+def test_quote_paths_agree(monkeypatch):
+    """
+    Test that small quotes priced item by item match the batch pricing engine.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    macbook.set_promotion(SecondHalfPrice.shared("Second Half price!"))
+    cart = [(macbook, 3), (store.get_product_by_name("Google Pixel 7"), 2),
+            (store.get_product_by_name("Shipping"), 1)]
+    small = store.quote(cart)
+    monkeypatch.setattr("store.QUOTE_BATCH_LINES", 0)
+    assert store.quote(cart) == small == 1450 * 2 + 725 + 1000 + 10
+
+def test_promotion_assignment_updates_store():
+    """
+    Test that assigning product.promotion directly keeps the store up to date.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    half = SecondHalfPrice.shared("Second Half price!")
+    macbook.promotion = half
+    assert store.get_promotion_quantity(half) == 100
+    assert [page for page in store.query(promoted=True)] == [[macbook]]
+    macbook.promotion = None
+    assert store.get_promotion_quantity(half) == 0
+    store.verify_aggregates()
+
+def test_checkout_many():
+    """
+    Test that a batch reports each order's total or the error that rejected it.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    pixel = store.get_product_by_name("Google Pixel 7")
+    results = store.checkout_many([[(macbook, 2)], [(pixel, 3)], [(pixel, 2), (macbook, 1)]])
+    assert results[0] == 2900
+    assert str(results[1]) == "Not enough quantity available."
+    assert results[2] == 1000 + 1450
+    assert store.get_total_quantity() == 352 - 5
+
+def test_failed_order_leaves_stock_untouched():
+    """
+    Test that an order with an invalid later line buys nothing.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    pixel = store.get_product_by_name("Google Pixel 7")
+    assert store.order([(macbook, 10), (pixel, 1), (pixel, 5)]) == 0
+    assert macbook.get_quantity() == 100
+    assert pixel.get_quantity() == 2
+    store.verify_aggregates()
+
+def test_unexpected_error_rolls_back_order():
+    """
+    Test that stock is put back whatever exception stops a checkout.
+    """
+    class Broken(SecondHalfPrice):
+        __slots__ = ()
+
+        def apply_promotion(self, product, quantity):
+            raise TypeError("broken promotion")
+
+    macbook = Product("MacBook Air M2", price=1450, quantity=10)
+    pixel = Product("Google Pixel 7", price=500, quantity=10)
+    pixel.promotion = Broken("Broken")
+    store = Store([macbook, pixel])
+    with pytest.raises(TypeError):
+        store.checkout([(macbook, 3), (pixel, 1)])
+    assert (macbook.get_quantity(), pixel.get_quantity()) == (10, 10)
+    store.verify_aggregates()
+
+def test_late_notification_from_removed_product_is_ignored():
+    """
+    Test that a change notification arriving after removal leaves the store alone.
+    """
+    store = make_store()
+    macbook = store.get_product_by_name("MacBook Air M2")
+    store.remove_product(macbook)
+    store._product_changed(macbook)
+    assert macbook not in store.get_all_products()
+    store.verify_aggregates()
+
+def test_concurrent_orders_do_not_oversell():
+    """
+    Test that many threads ordering a few hot products neither oversell
+    nor lose updates.
+    """
+    hot = [Product(f"Hot {i}", price=1, quantity=300) for i in range(4)]
+    store = Store(list(hot))
+    rng = random.Random(5)
+    carts = [[(rng.choice(hot), rng.randint(1, 5)) for _ in range(rng.randint(1, 3))]
+             for _ in range(3000)]
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        results = store.order_many(carts, max_workers=32)
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    sold = {product.product_id: 0 for product in hot}
+    for cart, total in zip(carts, results):
+        if total:
+            assert total == sum(quantity for _, quantity in cart)
+            for product, quantity in cart:
+                sold[product.product_id] += quantity
+    for product in hot:
+        assert product.get_quantity() == 300 - sold[product.product_id]
+        assert product.get_quantity() >= 0
+    assert store.get_total_quantity() == 1200 - sum(sold.values())
+    store.verify_aggregates()
+
+def test_query_pages_and_filters():
+    """
+    Test paging through the catalog with price, stock, promotion and name filters.
+    """
+    catalog = [Product(f"Item {i:03}", price=i % 50, quantity=i % 7) for i in range(200)]
+    for product in catalog[::3]:
+        product.set_promotion(SecondHalfPrice.shared("Second Half price!"))
+    store = Store(catalog, debug=True)
+
+    def listed(**filters):
+        return [product for page in store.query(**filters) for product in page]
+
+    assert [len(page) for page in store.query(page_size=64)] == [64, 64, 64, 8]
+    assert listed() == [product for product in catalog if product.is_active()]
+    cheap = listed(min_price=10, max_price=12, in_stock=True)
+    assert [p.price for p in cheap] == sorted(p.price for p in cheap)
+    assert {p.product_id for p in cheap} == {
+        p.product_id for p in catalog if p.is_active() and 10 <= p.price <= 12 and p.quantity}
+    assert listed(name_prefix="Item 01") == [p for p in catalog[10:20] if p.is_active()]
+    assert all(p.promotion is None for p in listed(promoted=False))
+
+    pages = store.query(min_price=45, page_size=5)
+    first = next(pages)
+    first[0].price = 1
+    store.get_product_by_name("Item 048").buy(1)
+    rest = [product for page in pages for product in page]
+    assert len({p.product_id for p in first + rest}) == len(first + rest)
+    assert all(p.price >= 45 for p in rest)
+
+
+def test_query_indexes_follow_catalog_changes(monkeypatch):
+    """
+    Test that the sorted indexes, once built by a query, stay in step with
+    price changes, sales and removals across many index buckets.
+    """
+    monkeypatch.setattr("store._SortedKeys.BUCKET", 4)
+    rng = random.Random(7)
+    catalog = [Product(f"Item {i:03}", price=rng.randrange(100), quantity=3) for i in range(120)]
+    store = Store(catalog, debug=True)
+    assert len(next(store.query(min_price=0))) == 20
+    for product in rng.sample(catalog, 60):
+        product.price = rng.randrange(100)
+    for product in catalog[::4]:
+        product.buy(3)
+    for product in catalog[::9]:
+        store.remove_product(product)
+
+    listed = [product for page in store.query(min_price=20, page_size=7) for product in page]
+    expected = sorted((p for p in store.get_all_products() if p.price >= 20),
+                      key=lambda p: (p.price, p.product_id))
+    assert listed == expected
+    assert ({p.product_id for page in store.query(in_stock=False) for p in page}
+            == {p.product_id for p in store.get_all_products() if not p.quantity})
+    for product in catalog[1::10]:
+        if store.get_product(product.product_id) is product:
+            product.promotion = SecondHalfPrice.shared("Second Half price!")
+    assert ([p for page in store.query(in_stock=True, page_size=6) for p in page]
+            == sorted((p for p in store.get_all_products() if p.quantity),
+                      key=lambda p: p.product_id))
+    assert ([p for page in store.query(promoted=True) for p in page]
+            == sorted((p for p in store.get_all_products() if p.promotion),
+                      key=lambda p: p.product_id))